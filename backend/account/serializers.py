@@ -33,7 +33,6 @@ class UserProfileCreateSerializer(serializers.ModelSerializer):
             validated_data.get('password'))
         validated_data['password2'] = make_password(
             validated_data.get('password2'))
-        print(validated_data)
         validated_data.pop('password2')
         return UserProfile.objects.create(**validated_data)
 
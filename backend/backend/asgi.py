@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported once Django is set up; streams new articles at /api/news/events/
+from news.events import route_events  # noqa: E402
+
+application = route_events(django_application)
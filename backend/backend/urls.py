@@ -14,9 +14,10 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from news.views import hashed_media
 
 
 urlpatterns = [
@@ -27,5 +28,10 @@ urlpatterns = [
 ]
 
 if settings.DEBUG is True:
+    # images stored under their sha256 get long lived immutable cache headers
+    urlpatterns += [
+        re_path(rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>posts_images/[0-9a-f]{{2}}/[0-9a-f]{{64}}[\w.-]*)$',
+                hashed_media),
+    ]
     urlpatterns += static(settings.MEDIA_URL,
                           document_root=settings.MEDIA_ROOT)
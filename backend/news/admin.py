@@ -1,5 +1,5 @@
 from django.contrib import admin
-from news.models import News, Comment
+from news.models import News, Comment, ScrapeJob, SourceLease
 
 # Register your models here.
 
@@ -9,7 +9,21 @@ class NewsAdmin(admin.ModelAdmin):
     model = News
     list_display = ('author', 'summary',
                     'created', 'created_ad', 'source')
-    list_filter = ('author', 'created', 'created_ad')
+    list_filter = ('source_key', 'author', 'created', 'created_ad')
 
 
 admin.site.register(Comment)
+
+
+@admin.register(ScrapeJob)
+class ScrapeJobAdmin(admin.ModelAdmin):
+    model = ScrapeJob
+    list_display = ('source', 'status', 'items_inserted', 'worker',
+                    'created_at', 'started_at', 'finished_at')
+    list_filter = ('source', 'status')
+
+
+@admin.register(SourceLease)
+class SourceLeaseAdmin(admin.ModelAdmin):
+    model = SourceLease
+    list_display = ('source', 'owner', 'acquired_at', 'expires_at')
@@ -0,0 +1,213 @@
+import hashlib
+import threading
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+
+from .singleflight import single_flight
+
+VERSION_KEY = 'news:version'
+
+
+def api_cache():
+    '''
+    The NEWS_CACHE cache. It must be shared by the web and scrape worker
+    processes, e.g. Redis or Memcached, as the worker's ingests invalidate
+    the web processes' entries through it.
+    '''
+    return caches[getattr(settings, 'NEWS_CACHE', 'default')]
+
+
+def caching_enabled():
+    '''
+    Whether responses are cached: only in a cache the processes share. In a
+    per-process one the web process would never see the worker's version
+    bumps and serve stale entries. A DummyCache turns caching off.
+    '''
+    return not isinstance(api_cache(), (LocMemCache, DummyCache))
+
+
+def check_cache(app_configs, **kwargs):
+    if not isinstance(api_cache(), LocMemCache):
+        return []
+    return [checks.Warning(
+        'NEWS_CACHE is a per-process cache; the news responses are not cached.',
+        hint='Point NEWS_CACHE at a cache shared with the scrape worker, e.g. Redis or Memcached.',
+        id='news.W001')]
+
+
+def current_version():
+    '''
+    Time in nanoseconds of the last change to the news data, which is part
+    of every response cache key. A new version is started when the counter
+    has been lost, orphaning the entries of the old one.
+    '''
+    cache = api_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(VERSION_KEY, version, None):
+            # another process started one at the same time
+            version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def bump_version():
+    '''
+    Invalidates every cached response. Call it once new data is committed.
+    '''
+    cache = api_cache()
+    cache.set(VERSION_KEY, max(time.time_ns(), (cache.get(VERSION_KEY) or 0) + 1), None)
+
+
+class CacheStats:
+    '''
+    Per-process counters of the response cache. Time saved is estimated as
+    the average time of a miss for every hit and 304, less the time the hits
+    themselves took. Requests that waited for a concurrent miss of the same
+    key instead of rendering it again are `coalesced`, and count as hits.
+    '''
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.coalesced = 0
+        self.hit_seconds = 0.0
+        self.miss_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, outcome, seconds):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            if outcome == 'misses':
+                self.miss_seconds += seconds
+            else:
+                self.hit_seconds += seconds
+
+    def stats(self):
+        with self._lock:
+            served = self.hits + self.not_modified + self.coalesced
+            requests = served + self.misses
+            average_miss = self.miss_seconds / self.misses if self.misses else 0
+            return {
+                'hits': self.hits, 'misses': self.misses,
+                'not_modified': self.not_modified, 'coalesced': self.coalesced,
+                'hit_ratio': served / requests if requests else 0,
+                'seconds_saved': max(0, served * average_miss - self.hit_seconds),
+            }
+
+
+stats = CacheStats()
+
+
+def response_key(request, version):
+    # the Accept header picks the renderer, JSON or the browsable API
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    return (f'news:response:{version}:{request.path}?{query}:'
+            f'{request.META.get("HTTP_ACCEPT", "")}')
+
+
+class CachedResponseMixin:
+    '''
+    Caches the rendered GET responses of a read-only view, keyed by path,
+    query parameters and data version, for NEWS_CACHE_TTL seconds, when
+    caching_enabled().
+
+    Responses carry an ETag hashed from their body, so a conditional request
+    is answered with 304 only when the body it would get is the one the
+    client has, cached or not. Concurrent misses of one key are rendered
+    once, see single_flight, so a version bump does not send every reader to
+    the database at once.
+
+    Authentication, permissions and throttles run before the cache is asked,
+    so the view's own checks guard cached responses too.
+    '''
+
+    throttles_checked = False
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET':
+            return super().dispatch(request, *args, **kwargs)
+
+        denied = self.check_request(request, *args, **kwargs)
+        if denied is not None:
+            return denied
+
+        start = time.perf_counter()
+        rendered = []
+
+        def render():
+            response = super(CachedResponseMixin, self).dispatch(request, *args, **kwargs)
+            rendered.append(response)
+            if response.status_code != 200:
+                return None
+            response.render()
+            content_type = response['Content-Type']
+            digest = hashlib.sha1(content_type.encode() + b'\n' + response.content).hexdigest()
+            return response.content, content_type, quote_etag(digest)
+
+        if caching_enabled():
+            cache = api_cache()
+            key = response_key(request, current_version())
+            cached = cache.get(key)
+            outcome = 'hits'
+            if cached is None:
+                cached = single_flight(cache, key, render, getattr(settings, 'NEWS_CACHE_TTL', 300))
+                outcome = 'misses' if rendered else 'coalesced'
+        else:
+            cached = render()
+            outcome = 'misses'
+
+        if rendered and rendered[0].status_code != 200:
+            return rendered[0]
+        content, content_type, etag = cached
+
+        response = get_conditional_response(request, etag)
+        if response is not None:
+            # a 304 saves the rendering only when it came from the cache
+            outcome = outcome if rendered else 'not_modified'
+        elif rendered:
+            response = rendered[0]
+        else:
+            response = HttpResponse(content, content_type=content_type)
+        stats.record(outcome, time.perf_counter() - start)
+        return self.add_validators(response, etag)
+
+    def check_request(self, request, *args, **kwargs):
+        '''
+        Runs the view's initial() checks on `request` as dispatch() would,
+        returning the error response when one fails.
+        '''
+        self.args, self.kwargs = args, kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            self.initial(request, *args, **kwargs)
+        except Exception as exc:
+            self.response = self.finalize_response(
+                request, self.handle_exception(exc), *args, **kwargs)
+            return self.response
+        return None
+
+    def check_throttles(self, request):
+        # once per request: a miss runs initial() again to render
+        if not self.throttles_checked:
+            self.throttles_checked = True
+            super().check_throttles(request)
+
+    def add_validators(self, response, etag):
+        response['ETag'] = etag
+        # clients keep the body but check it is current on every use
+        response['Cache-Control'] = 'no-cache'
+        patch_vary_headers(response, ['Accept'])
+        return response
@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class NewsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'news'
+
+    def ready(self):
+        from .apicache import check_cache
+        checks.register(check_cache, checks.Tags.caches)
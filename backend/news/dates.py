@@ -0,0 +1,168 @@
+import datetime
+import re
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .search import fold
+
+# the sources print Nepal time
+NEPAL = ZoneInfo('Asia/Kathmandu')
+
+# days in each month of the Bikram Sambat years, which follow no rule and are
+# set by the calendar committee; dates outside the table are left unparsed
+BS_MONTH_DAYS = {
+    2070: (31, 31, 31, 32, 31, 31, 30, 29, 30, 29, 30, 30),
+    2071: (31, 31, 32, 31, 31, 31, 30, 29, 30, 29, 30, 30),
+    2072: (31, 32, 31, 32, 31, 30, 30, 29, 30, 29, 30, 30),
+    2073: (31, 32, 31, 32, 31, 30, 30, 30, 29, 29, 30, 31),
+    2074: (31, 31, 31, 32, 31, 31, 30, 29, 30, 29, 30, 30),
+    2075: (31, 31, 32, 31, 31, 31, 30, 29, 30, 29, 30, 30),
+    2076: (31, 32, 31, 32, 31, 30, 30, 30, 29, 29, 30, 30),
+    2077: (31, 32, 31, 32, 31, 30, 30, 30, 29, 30, 29, 31),
+    2078: (31, 31, 31, 32, 31, 31, 30, 29, 30, 29, 30, 30),
+    2079: (31, 31, 32, 31, 31, 31, 30, 29, 30, 29, 30, 30),
+    2080: (31, 32, 31, 32, 31, 30, 30, 30, 29, 29, 30, 30),
+    2081: (31, 31, 32, 32, 31, 30, 30, 30, 29, 30, 30, 30),
+    2082: (30, 32, 31, 32, 31, 30, 30, 30, 29, 30, 30, 30),
+    2083: (31, 31, 32, 31, 31, 30, 30, 30, 29, 30, 30, 30),
+    2084: (31, 31, 32, 31, 31, 30, 30, 30, 29, 30, 30, 30),
+    2085: (31, 32, 31, 32, 30, 31, 30, 30, 29, 30, 30, 30),
+    2086: (30, 32, 31, 32, 31, 30, 30, 30, 29, 30, 30, 30),
+    2087: (31, 31, 32, 31, 31, 31, 30, 30, 29, 30, 30, 30),
+    2088: (30, 31, 32, 32, 30, 31, 30, 30, 29, 30, 30, 30),
+    2089: (30, 32, 31, 32, 31, 30, 30, 30, 29, 30, 30, 30),
+    2090: (30, 32, 31, 32, 31, 30, 30, 30, 29, 30, 30, 30),
+}
+# 1 Baisakh 2070
+BS_EPOCH = (2070, datetime.date(2013, 4, 14))
+
+# every spelling of the month names seen on the sources, in month order
+BS_MONTHS = [
+    ('बैशाख', 'वैशाख', 'बैसाख'),
+    ('जेठ', 'जेष्ठ'),
+    ('असार', 'आषाढ', 'असाढ'),
+    ('साउन', 'श्रावण'),
+    ('भदौ', 'भाद्र'),
+    ('असोज', 'आश्विन'),
+    ('कात्तिक', 'कार्तिक'),
+    ('मंसिर', 'मङ्सिर', 'मार्ग'),
+    ('पुस', 'पौष', 'पुष'),
+    ('माघ',),
+    ('फागुन', 'फाल्गुन'),
+    ('चैत', 'चैत्र'),
+]
+_BS_MONTH = {fold(name): month for month, names in enumerate(BS_MONTHS, 1)
+             for name in names}
+_AD_MONTH = {name: month for month in range(1, 13)
+             for name in (datetime.date(2000, month, 1).strftime('%B').lower(),
+                          datetime.date(2000, month, 1).strftime('%b').lower())}
+
+# the text is folded, so English names are lower case
+_MONTH = r'(?P<month>[a-z\u0900-\u0963]+)'
+_TIME = r'(?:\D*?(?P<hour>\d{1,2}):(?P<minute>\d{2})(?:\s*(?P<ampm>am|pm))?)?'
+PATTERNS = [
+    # Ekantipur and Nagarik: माघ १६, २०७९ with an optional time
+    re.compile(_MONTH + r'\s+(?P<day>\d{1,2}),?\s+(?P<year>\d{4})' + _TIME),
+    # Onlinekhabar: २०७९ माघ १६ गते १०:१५
+    re.compile(r'(?P<year>\d{4})\s+' + _MONTH + r'\s+(?P<day>\d{1,2})' + _TIME),
+    # English dates: 30 January 2023
+    re.compile(r'(?P<day>\d{1,2})\s+' + _MONTH + r',?\s+(?P<year>\d{4})' + _TIME),
+]
+RELATIVE = re.compile(
+    r'(?P<count>\d+)\s*(?P<unit>मिनेट|minutes?|mins?|घण्टा|घन्टा|hours?|दिन|days?)'
+    r'\s*(?:अगाडि|अघि|पहिले|ago)')
+RELATIVE_UNITS = {'मिनेट': 'minutes', 'minute': 'minutes', 'min': 'minutes',
+                  'घण्टा': 'hours', 'घन्टा': 'hours', 'hour': 'hours',
+                  'दिन': 'days', 'day': 'days'}
+
+
+def bs_to_ad(year, month, day):
+    '''
+    The Gregorian date of a Bikram Sambat date. Raises ValueError for dates
+    that do not exist or are outside BS_MONTH_DAYS.
+    '''
+    if year not in BS_MONTH_DAYS or not 1 <= month <= 12 \
+            or not 1 <= day <= BS_MONTH_DAYS[year][month - 1]:
+        raise ValueError(f'no Bikram Sambat date {year}-{month}-{day}')
+    epoch_year, epoch = BS_EPOCH
+    days = sum(sum(BS_MONTH_DAYS[y]) for y in range(epoch_year, year))
+    days += sum(BS_MONTH_DAYS[year][:month - 1]) + day - 1
+    return epoch + datetime.timedelta(days=days)
+
+
+def _aware(value):
+    # naive datetimes are stored in TIME_ZONE when USE_TZ is off
+    return value if settings.USE_TZ else timezone.make_naive(value)
+
+
+def _absolute(match):
+    year, day = int(match['year']), int(match['day'])
+    name = match['month']
+    if fold(name) in _BS_MONTH:
+        date = bs_to_ad(year, _BS_MONTH[fold(name)], day)
+    elif name.lower() in _AD_MONTH:
+        date = datetime.date(year, _AD_MONTH[name.lower()], day)
+    else:
+        return None
+
+    hour, minute = int(match['hour'] or 0), int(match['minute'] or 0)
+    if match['ampm'] == 'pm' and hour < 12:
+        hour += 12
+    elif match['ampm'] == 'am' and hour == 12:
+        hour = 0
+    return datetime.datetime.combine(date, datetime.time(hour, minute), NEPAL)
+
+
+def parse_published(text, reference=None):
+    '''
+    The publication time printed on a source page as an aware datetime, or
+    None when `text` is not in a known format.
+
+    Understands Bikram Sambat and English dates with an optional time, in
+    Devanagari or ASCII digits, ISO 8601, and relative times such as
+    "३ घण्टा अगाडि", which count back from `reference` (default now).
+    '''
+    if not text:
+        return None
+    text = fold(text.strip())
+
+    try:
+        value = datetime.datetime.fromisoformat(text)
+    except ValueError:
+        pass
+    else:
+        return _aware(value if timezone.is_aware(value) else value.replace(tzinfo=NEPAL))
+
+    match = RELATIVE.search(text)
+    if match:
+        unit = RELATIVE_UNITS[match['unit'].rstrip('s')]
+        delta = datetime.timedelta(**{unit: int(match['count'])})
+        return _aware((reference or timezone.now()) - delta)
+
+    for pattern in PATTERNS:
+        for match in pattern.finditer(text):
+            try:
+                value = _absolute(match)
+            except ValueError:
+                return None
+            if value is not None:
+                return _aware(value)
+    return None
+
+
+def parse_iso(value):
+    '''
+    An ISO 8601 date or time given by a client as an aware datetime, with
+    dates at midnight and naive times in TIME_ZONE. Raises ValueError.
+    '''
+    parsed = parse_datetime(value)
+    if parsed is None and parse_date(value) is not None:
+        parsed = datetime.datetime.combine(parse_date(value), datetime.time())
+    if parsed is None:
+        raise ValueError(f'{value!r} is not an ISO 8601 date or time')
+    if settings.USE_TZ and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
@@ -0,0 +1,187 @@
+import logging
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urljoin, urldefrag
+
+from . import metrics
+from .fetch import fetcher, ARTICLE_TTL
+from .ingest import persist_articles
+from .models import News
+from .parsing import make_soup
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Article:
+    source: str
+    source_key: str
+    url: str
+    title: str
+    summary: str = ''
+    author: str = ''
+    published: str = ''
+    content: str = ''
+    image_url: Optional[str] = None
+
+    def as_fields(self):
+        '''
+        The article in the shape persist_articles expects.
+        '''
+        return {
+            'url': self.url, 'title': self.title, 'summary': self.summary,
+            'author': self.author, 'created': self.published,
+            'content': self.content, 'source': self.source,
+            'source_key': self.source_key, 'image_url': self.image_url,
+        }
+
+
+def _noop(stage):
+    pass
+
+
+def canonical_url(link, base=None):
+    '''
+    Absolute article URL without its fragment, used as the unique key of a News row.
+    '''
+    if base:
+        link = urljoin(base, link)
+    return urldefrag(link)[0]
+
+
+def new_article_indexes(urls):
+    '''
+    Returns the indexes of `urls` that are not stored yet, with a single query
+    for the whole listing. Repeated links are only kept once.
+    '''
+    existing = set(News.objects.filter(
+        url__in=urls).values_list('url', flat=True))
+    fresh = []
+    for i, url in enumerate(urls):
+        if url not in existing:
+            existing.add(url)
+            fresh.append(i)
+    return fresh
+
+
+def extract(element, fields):
+    '''
+    Reads every Field in `fields` below `element`. Fields whose selector does
+    not match are left out.
+    '''
+    values = {}
+    for name, spec in fields.items():
+        if spec.many:
+            matches = element.select(spec.selector)
+            if matches:
+                values[name] = ''.join(
+                    match.get_text().strip() + "\n\n" for match in matches)
+            continue
+
+        match = element.select_one(spec.selector)
+        if match is None:
+            continue
+        value = match.get(spec.attr) if spec.attr else match.get_text()
+        if value:
+            values[name] = value.strip()
+    return values
+
+
+def parse_listing(spec, html, backend=None, scoped=True):
+    '''
+    Returns one dict of listing values per homepage item that has a title and
+    a link, with the link made canonical.
+    '''
+    soup = make_soup(html, spec.listing_scope if scoped else None, backend)
+    items = []
+    for element in soup.select(spec.items):
+        values = extract(element, spec.listing_fields)
+        if values.get('url') and values.get('title'):
+            values['url'] = canonical_url(values['url'], spec.homepage)
+            items.append(values)
+    return items
+
+
+def parse_detail(spec, listing, html, backend=None, scoped=True):
+    '''
+    Builds the Article of one listing item from its detail page, or returns
+    None when the page does not have the expected layout or lacks one of the
+    required fields.
+    '''
+    soup = make_soup(html, spec.detail_scope if scoped else None, backend)
+    root = soup.select_one(spec.root) if spec.root else soup
+    if root is None:
+        return None
+
+    detail = extract(root, spec.detail_fields)
+    if any(not detail.get(name, '').strip() for name in spec.required):
+        return None
+    values = dict(listing)
+    values.update(detail)
+    if values.get('image_url'):
+        values['image_url'] = urljoin(values['url'], values['image_url'])
+    return Article(source=spec.name, source_key=spec.key, **values)
+
+
+def iter_articles(spec, progress=_noop, on_skip=_noop, timings=None):
+    '''
+    Yields an Article for every homepage item of `spec` that is not stored yet.
+    Only new articles get their detail page fetched; `on_skip` is called with
+    the url of every one whose page could not be fetched or parsed.
+
+    The seconds spent in every stage are added to the `timings` dict, if given,
+    and observed in metrics.SCRAPE_STAGE_SECONDS.
+    '''
+    progress("fetching homepage")
+    with metrics.stage(spec.key, 'fetch_homepage', timings):
+        html = fetcher.get_text(spec.homepage)
+    with metrics.stage(spec.key, 'parse_listing', timings):
+        listing = parse_listing(spec, html)
+    with metrics.stage(spec.key, 'lookup', timings):
+        fresh = new_article_indexes([item['url'] for item in listing])
+    listing = [listing[i] for i in fresh]
+
+    progress(f"fetching {len(listing)} detail pages")
+    with metrics.stage(spec.key, 'fetch_detail', timings):
+        pages = fetcher.fetch_all([item['url'] for item in listing], ttl=ARTICLE_TTL)
+    for item, html in zip(listing, pages):
+        if html is None:
+            metrics.SCRAPE_ERRORS.inc(source=spec.key, stage='fetch_detail')
+            on_skip(item['url'])
+            continue
+        with metrics.stage(spec.key, 'parse_detail', timings):
+            article = parse_detail(spec, item, html)
+        if article is None:
+            metrics.SCRAPE_ERRORS.inc(source=spec.key, stage='parse_detail')
+            logger.warning('Unexpected layout of %s', item['url'], extra={
+                'event': 'scrape_skip', 'source': spec.key, 'stage': 'parse_detail',
+                'url': item['url']})
+            on_skip(item['url'])
+            continue
+        yield article
+
+
+def scrape(spec, progress=_noop, timings=None):
+    '''
+    Scrapes the new articles of `spec` and saves them, returning the IngestResult
+    with the seconds spent in every stage in its `stage_seconds`. Pass a dict as
+    `timings` to keep the stages timed so far when the scrape raises.
+    '''
+    timings = {} if timings is None else timings
+    skipped = []
+    articles = list(iter_articles(spec, progress, skipped.append, timings))
+    progress("saving articles")
+    # persist is the wall time of saving; write and image are parts of it
+    with metrics.stage(spec.key, 'persist', timings):
+        result = persist_articles([article.as_fields() for article in articles],
+                                  timings=timings)
+    result.skipped += len(skipped)
+    result.stage_seconds = timings
+
+    for outcome in ('inserted', 'updated', 'skipped'):
+        metrics.SCRAPE_ARTICLES.inc(getattr(result, outcome), source=spec.key, outcome=outcome)
+    logger.info('Scraped %s', spec.name, extra={
+        'event': 'scrape', 'source': spec.key, 'inserted': result.inserted,
+        'updated': result.updated, 'skipped': result.skipped,
+        'stage_seconds': {stage: round(seconds, 4) for stage, seconds in timings.items()}})
+    return result
@@ -0,0 +1,310 @@
+import asyncio
+import logging
+import threading
+import time
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max, Q
+from django.utils.module_loading import import_string
+
+from .models import News
+from .sources import SOURCES
+
+logger = logging.getLogger(__name__)
+
+# served by event_stream in front of Django, see route_events
+EVENTS_PATH = '/api/news/events/'
+
+HEARTBEAT = 15
+RECONNECT_MS = 5000
+REPLAY_LIMIT = 500
+# how long an id skipped by the poll is looked for again; on Postgres a
+# transaction can take ids below the latest committed one and commit later
+LATE_COMMIT_SECONDS = 60
+
+_encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+
+def article_events(after, sources=None, limit=REPLAY_LIMIT, missing=()):
+    '''
+    Compact events of the stored articles with an id above `after` or among
+    the `missing` ids, in id order, optionally only those of the `sources`
+    keys.
+    '''
+    queryset = News.objects.filter(Q(id__gt=after) | Q(id__in=missing))
+    if sources:
+        queryset = queryset.filter(source_key__in=sources)
+    rows = queryset.order_by('id').values('id', 'source_key', 'title', 'published_at')[:limit]
+    return [{'id': row['id'], 'source': row['source_key'], 'title': row['title'],
+             'published_at': row['published_at']} for row in rows]
+
+
+def latest_id():
+    return News.objects.aggregate(latest=Max('id'))['latest'] or 0
+
+
+class Listener:
+    '''
+    The queue of events for one client. A client that falls a whole queue
+    behind is marked `overflowed` instead of having events dropped; its
+    stream ends and it resumes from its Last-Event-ID. None in the queue is
+    a heartbeat.
+    '''
+
+    def __init__(self, broadcaster, sources):
+        self.broadcaster = broadcaster
+        self.sources = set(sources) if sources else None
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(broadcaster.queue_size)
+        self.overflowed = False
+
+    def wants(self, event):
+        return self.sources is None or event['source'] in self.sources
+
+    def put(self, event):
+        if not self.queue.full():
+            self.queue.put_nowait(event)
+        elif event is not None:
+            self.overflowed = True
+
+    async def get(self):
+        return await self.queue.get()
+
+    async def __aenter__(self):
+        self.broadcaster.add(self)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.broadcaster.remove(self)
+
+
+def _deliver(listeners, event):
+    for listener in listeners:
+        listener.put(event)
+
+
+class LocalBroadcaster:
+    '''
+    Fans events out to the listeners of this process. Nothing feeds it by
+    itself: events come from publish(), which any thread may call, so it
+    stands in for the real feed in tests and single-process setups.
+
+    Its tasks run only while someone listens: one heartbeat for all the
+    listeners every HEARTBEAT seconds, so an idle client has no timer of
+    its own.
+    '''
+
+    def __init__(self, queue_size=None):
+        self.queue_size = queue_size or getattr(settings, 'NEWS_EVENTS_QUEUE_SIZE', 100)
+        self.listeners = set()
+        self._lock = threading.Lock()
+        self._tasks = []
+
+    def listen(self, sources=None):
+        return Listener(self, sources)
+
+    def add(self, listener):
+        with self._lock:
+            self.listeners.add(listener)
+            if not self._tasks:
+                self._tasks = [listener.loop.create_task(feed()) for feed in self.feeds()]
+
+    def remove(self, listener):
+        with self._lock:
+            self.listeners.discard(listener)
+            tasks = [] if self.listeners else self._tasks
+            if tasks:
+                self._tasks = []
+        for task in tasks:
+            task.cancel()
+
+    def feeds(self):
+        return [self._heartbeat]
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT)
+            self._fan_out(list(self.listeners), None)
+
+    def publish(self, event):
+        with self._lock:
+            listeners = [listener for listener in self.listeners if listener.wants(event)]
+        self._fan_out(listeners, event)
+
+    def _fan_out(self, listeners, event):
+        loops = {}
+        for listener in listeners:
+            loops.setdefault(listener.loop, []).append(listener)
+        # one wakeup per event loop rather than per listener
+        for loop, group in loops.items():
+            loop.call_soon_threadsafe(_deliver, group, event)
+
+
+class PollingBroadcaster(LocalBroadcaster):
+    '''
+    Feeds the listeners of this process from one query for articles committed
+    since the last poll, every NEWS_EVENTS_POLL_INTERVAL seconds while anyone
+    is listening. Articles are written by the scrape worker, another process,
+    so the database is where they meet; the cost is one query per interval and
+    process whatever the number of clients.
+
+    Ids are not handed out in commit order, so the ids a poll skips over are
+    asked for again for LATE_COMMIT_SECONDS, in case the rows behind them are
+    still to be committed.
+
+    A broadcaster on a pub/sub server would replace this by publishing what
+    a SUBSCRIBE loop receives.
+    '''
+
+    def __init__(self, interval=None, **kwargs):
+        super().__init__(**kwargs)
+        self.interval = interval or getattr(settings, 'NEWS_EVENTS_POLL_INTERVAL', 2)
+
+    def feeds(self):
+        return super().feeds() + [self._poll]
+
+    async def _poll(self):
+        after = await sync_to_async(latest_id)()
+        # skipped id -> when it was first skipped
+        missing = {}
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                events = await sync_to_async(article_events)(after, missing=list(missing))
+            except Exception:
+                # a database hiccup must not end the feed of every client
+                logger.exception('Polling for new articles failed')
+                continue
+            now = time.monotonic()
+            for event in events:
+                if event['id'] > after:
+                    # a jump of the sequence is not worth asking about in full
+                    skipped = range(max(after + 1, event['id'] - REPLAY_LIMIT), event['id'])
+                    missing.update(dict.fromkeys(skipped, now))
+                    after = event['id']
+                missing.pop(event['id'], None)
+                self.publish(event)
+            missing = {id: since for id, since in missing.items()
+                       if now - since < LATE_COMMIT_SECONDS}
+
+
+_broadcasters = {}
+
+
+def get_broadcaster():
+    '''
+    The broadcaster of this process, of the class named by the
+    NEWS_EVENTS_BROADCASTER setting.
+    '''
+    path = getattr(settings, 'NEWS_EVENTS_BROADCASTER', 'news.events.PollingBroadcaster')
+    if path not in _broadcasters:
+        _broadcasters[path] = import_string(path)()
+    return _broadcasters[path]
+
+
+def _frame(event):
+    return (f"id: {event['id']}\nevent: article\n"
+            f"data: {_encoder.encode(event)}\n\n").encode()
+
+
+def _cors_headers(origin):
+    allowed = getattr(settings, 'CORS_ALLOWED_ORIGINS', [])
+    if origin and (getattr(settings, 'CORS_ALLOW_ALL_ORIGINS', False) or origin in allowed):
+        return [(b'access-control-allow-origin', origin.encode())]
+    return []
+
+
+async def _disconnected(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _respond(send, status, body):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+    await send({'type': 'http.response.body', 'body': body.encode()})
+
+
+async def event_stream(scope, receive, send):
+    '''
+    ASGI app streaming an `article` Server-Sent Event for every new article
+    of the `sources` in the query string (all by default). A reconnecting
+    client gets the articles after its Last-Event-ID replayed first.
+
+    An idle client holds two suspended coroutines and a queue; nothing runs
+    for it but the broadcaster's heartbeat, a comment line every HEARTBEAT
+    seconds that keeps proxies from closing the connection.
+
+    A replay is at most REPLAY_LIMIT articles; a longer one ends the stream
+    after them, and the client reconnects from the last one it got.
+    '''
+    query = parse_qs(scope['query_string'].decode())
+    sources = [source for value in query.get('sources', []) for source in value.split(',') if source]
+    unknown = set(sources) - set(SOURCES)
+    if unknown:
+        return await _respond(send, 400, f"Unknown sources: {', '.join(sorted(unknown))}")
+
+    headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+    last_id = headers.get('last-event-id', '')
+    last_id = int(last_id) if last_id.isdigit() else None
+
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream; charset=utf-8'),
+        (b'cache-control', b'no-cache'),
+        # nginx would otherwise buffer the stream
+        (b'x-accel-buffering', b'no'),
+    ] + _cors_headers(headers.get('origin'))})
+
+    # a client going away cancels the stream wherever it waits
+    stream = asyncio.current_task()
+    closed = False
+
+    async def watch():
+        nonlocal closed
+        await _disconnected(receive)
+        closed = True
+        stream.cancel()
+
+    watcher = asyncio.ensure_future(watch())
+    try:
+        # listen before replaying, so nothing committed in between is missed
+        async with get_broadcaster().listen(sources) as listener:
+            body = f'retry: {RECONNECT_MS}\n\n'.encode()
+            replay = []
+            if last_id is not None:
+                replay = await sync_to_async(article_events)(last_id, sources, REPLAY_LIMIT)
+                body += b''.join(_frame(event) for event in replay)
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+
+            # a live event can also have been replayed
+            replayed = {event['id'] for event in replay}
+            while len(replay) < REPLAY_LIMIT and not listener.overflowed:
+                event = await listener.get()
+                if event is None:
+                    body = b': keepalive\n\n'
+                elif event['id'] not in replayed:
+                    body = _frame(event)
+                else:
+                    continue
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    except asyncio.CancelledError:
+        if not closed:
+            raise
+    finally:
+        watcher.cancel()
+
+
+def route_events(application):
+    '''
+    Wraps the Django ASGI `application` so EVENTS_PATH is answered by
+    event_stream, without a thread per open stream.
+    '''
+    async def router(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == EVENTS_PATH:
+            return await event_stream(scope, receive, send)
+        return await application(scope, receive, send)
+    return router
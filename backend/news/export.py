@@ -0,0 +1,56 @@
+import csv
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import News
+
+EXPORT_FIELDS = ['id', 'url', 'source', 'source_key', 'title', 'summary',
+                 'author', 'content', 'created', 'published_at', 'ingested_at',
+                 'story_id', 'comment_count']
+
+
+def export_rows(source=None, published_after=None, published_before=None, after=0,
+                chunk_size=None):
+    '''
+    Yields the EXPORT_FIELDS of the matching News rows as tuples, in id
+    order from the first id above `after`. The rows are read in chunks of
+    `chunk_size` through a database cursor, so memory does not grow with
+    the number of rows; an interrupted export resumes with `after` set to the
+    last id it wrote.
+    '''
+    queryset = News.objects.filter(id__gt=after or 0)
+    if source:
+        queryset = queryset.filter(source_key=source.lower())
+    if published_after:
+        queryset = queryset.filter(published_at__gte=published_after)
+    if published_before:
+        queryset = queryset.filter(published_at__lt=published_before)
+    chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    return queryset.order_by('id').values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def ndjson_lines(rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(EXPORT_FIELDS, row))) + '\n'
+
+
+class _Line:
+    # csv.writer writes into this and gets the line back
+    def write(self, line):
+        return line
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow([value.isoformat() if hasattr(value, 'isoformat') else value
+                               for value in row])
+
+
+FORMATS = {
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+    'csv': (csv_lines, 'text/csv'),
+}
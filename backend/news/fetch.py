@@ -0,0 +1,294 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from . import metrics
+from .httpcache import default_cache
+
+logger = logging.getLogger(__name__)
+
+# responses that mean the host is overloaded or restarting, worth another try
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class FetchError(requests.RequestException):
+    pass
+
+
+class CircuitOpen(FetchError):
+    pass
+
+
+class RetryPolicy:
+    '''
+    Timeouts and retry schedule of the fetcher, read from settings by default.
+
+    Failed attempts are retried up to `attempts` times in total, waiting a
+    random time between 0 and `backoff * 2 ** (attempt - 1)` seconds, capped
+    at `max_backoff`.
+    '''
+
+    def __init__(self, connect_timeout=None, read_timeout=None, attempts=None,
+                 backoff=None, max_backoff=None):
+        self.connect_timeout = connect_timeout or getattr(
+            settings, 'SCRAPER_CONNECT_TIMEOUT', 5)
+        self.read_timeout = read_timeout or getattr(
+            settings, 'SCRAPER_READ_TIMEOUT', 20)
+        self.attempts = attempts or getattr(settings, 'SCRAPER_RETRIES', 3)
+        self.backoff = backoff if backoff is not None else getattr(
+            settings, 'SCRAPER_BACKOFF', 1)
+        self.max_backoff = max_backoff or getattr(
+            settings, 'SCRAPER_MAX_BACKOFF', 30)
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    '''
+    Stops requests to a host for `cooldown` seconds once `threshold` attempts
+    in a row have failed. After the cool-down one trial request is let
+    through: if it succeeds the circuit closes, otherwise it opens again.
+    '''
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, threshold=None, cooldown=None):
+        self.threshold = threshold or getattr(
+            settings, 'SCRAPER_BREAKER_THRESHOLD', 5)
+        self.cooldown = cooldown or getattr(
+            settings, 'SCRAPER_BREAKER_COOLDOWN', 60)
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.requests = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def before_request(self, host):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    raise CircuitOpen(f'circuit for {host} is open')
+                self.state = self.HALF_OPEN
+            elif self.state == self.HALF_OPEN:
+                # a trial request is already in flight
+                raise CircuitOpen(f'circuit for {host} is half-open')
+            self.requests += 1
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    @property
+    def is_open(self):
+        return self.state == self.OPEN
+
+    def stats(self):
+        return {'state': self.state, 'consecutive_failures': self.failures,
+                'requests': self.requests, 'retries': self.retries}
+
+
+class Fetcher:
+    '''
+    Shared fetch layer for the scrapers.
+
+    One pooled requests.Session is kept per source host so that connections are
+    reused between pages, and detail pages are fetched concurrently on a thread
+    pool. No more than `per_host` requests run against the same host at a time.
+
+    Every request has connect and read timeouts and is retried according to
+    the RetryPolicy. A CircuitBreaker per host makes requests to a host that
+    keeps failing fail at once, so one dead site cannot hold up the others.
+
+    With a ResponseCache, page bodies younger than the `ttl` passed to
+    get_text are served from disk, and older ones are revalidated with a
+    conditional request. `cache` may also be a function returning one, which
+    is called on first use.
+    '''
+
+    def __init__(self, max_workers=None, per_host=None, cache=None, policy=None):
+        self.max_workers = max_workers or getattr(
+            settings, 'SCRAPER_MAX_WORKERS', 16)
+        self.per_host = per_host or getattr(
+            settings, 'SCRAPER_PER_HOST_CONCURRENCY', 8)
+        self._cache = cache
+        self.policy = policy or RetryPolicy()
+        self._sessions = {}
+        self._slots = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        with self._lock:
+            if callable(self._cache):
+                self._cache = self._cache()
+        return self._cache
+
+    def _host(self, url):
+        return urlsplit(url).netloc
+
+    def session_for(self, url):
+        host = self._host(url)
+        with self._lock:
+            if host not in self._sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1,
+                                      pool_maxsize=self.per_host)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[host] = session
+                self._slots[host] = threading.BoundedSemaphore(self.per_host)
+                self._breakers[host] = CircuitBreaker()
+            return self._sessions[host], self._slots[host], self._breakers[host]
+
+    def get(self, url, **kwargs):
+        '''
+        GETs `url`, retrying connection errors, timeouts and RETRY_STATUSES.
+        Raises FetchError once the attempts are used up, on any other
+        requests error, or when the host's circuit is open. Other responses,
+        404 included, are returned as they are.
+        '''
+        host = self._host(url)
+        session, slot, breaker = self.session_for(url)
+        kwargs.setdefault('timeout', self.policy.timeout)
+
+        for attempt in range(1, self.policy.attempts + 1):
+            try:
+                breaker.before_request(host)
+            except CircuitOpen:
+                metrics.FETCH_FAILURES.inc(host=host)
+                raise
+            try:
+                with slot:
+                    response = session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            except requests.RequestException as e:
+                # redirect loops, bad urls and broken bodies: not worth another try
+                breaker.record_failure()
+                metrics.FETCH_FAILURES.inc(host=host)
+                raise FetchError(f'giving up on {url}: {e!r}') from e
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    breaker.record_success()
+                    return response
+                response.close()
+                error = FetchError(f'{response.status_code} from {url}')
+
+            breaker.record_failure()
+            if attempt == self.policy.attempts or breaker.is_open:
+                break
+            breaker.record_retry()
+            metrics.FETCH_RETRIES.inc(host=host)
+            time.sleep(self.policy.delay(attempt))
+
+        metrics.FETCH_FAILURES.inc(host=host)
+        raise FetchError(f'giving up on {url} after {attempt} attempts: {error}') from error
+
+    def get_text(self, url, ttl=0):
+        '''
+        Returns the body of `url`. A cached copy younger than `ttl` seconds is
+        used without touching the network; `ttl=None` never expires it.
+        Raises FetchError for a response that is not a success, such as a
+        404, whose body is an error page rather than the page asked for.
+        '''
+        if self.cache is None:
+            response = self.get(url)
+            self._count_bytes(url, response)
+            return self._text(url, response)
+
+        entry = self.cache.get(url)
+        if entry is not None and (ttl is None or entry.age < ttl):
+            self.cache.record('hits')
+            return entry.body
+
+        response = self.get(url, headers=entry.validators() if entry else {})
+        if entry is not None and response.status_code == 304:
+            self.cache.record('revalidated')
+            self.cache.touch(url)
+            return entry.body
+
+        self.cache.record('misses')
+        self._count_bytes(url, response)
+        text = self._text(url, response)
+        self.cache.store(url, response)
+        return text
+
+    def _text(self, url, response):
+        if not 200 <= response.status_code < 300:
+            raise FetchError(f'{response.status_code} from {url}')
+        return response.text
+
+    def _count_bytes(self, url, response):
+        metrics.DOWNLOAD_BYTES.inc(len(response.content), host=self._host(url), kind='page')
+
+    def _get_text_or_none(self, url, ttl):
+        try:
+            return self.get_text(url, ttl)
+        except FetchError as e:
+            logger.warning('Skipping %s: %s', url, e, extra={
+                'event': 'fetch_skip', 'url': url, 'host': self._host(url)})
+            return None
+
+    def fetch_all(self, urls, ttl=0):
+        '''
+        Returns the bodies of `urls` in the same order, fetched concurrently,
+        with None in place of the pages that could not be fetched.
+        '''
+        urls = list(urls)
+        if not urls:
+            return []
+        workers = min(self.max_workers, len(urls))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda url: self._get_text_or_none(url, ttl), urls))
+
+    def stats(self):
+        with self._lock:
+            breakers = dict(self._breakers)
+        stats = {'hosts': {host: breaker.stats()
+                           for host, breaker in breakers.items()}}
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+        return stats
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._slots.clear()
+
+
+# article pages do not change once published, so they are not revalidated
+# for a day by default
+ARTICLE_TTL = getattr(settings, 'SCRAPER_ARTICLE_CACHE_TTL', 24 * 60 * 60)
+
+# the cache directory is only read once something is fetched, so importing
+# this in a web process costs nothing
+fetcher = Fetcher(cache=default_cache)
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+
+class CacheEntry:
+    def __init__(self, url, body, etag=None, last_modified=None, stored_at=None):
+        self.url = url
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = stored_at or time.time()
+
+    @property
+    def age(self):
+        return time.time() - self.stored_at
+
+    def validators(self):
+        '''
+        Conditional request headers that let the server answer 304 Not Modified.
+        '''
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    '''
+    On-disk cache of page bodies keyed by url, kept with their ETag and
+    Last-Modified headers so that stale entries can be revalidated.
+
+    Every entry is a `<key>.html` body next to a `<key>.json` header file. Once
+    the bodies grow past `max_bytes` the least recently used entries are evicted.
+    '''
+
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(os.path.getsize(path) for path in self._bodies())
+
+    def _key(self, url):
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def _paths(self, url):
+        key = self._key(url)
+        return (os.path.join(self.directory, f'{key}.html'),
+                os.path.join(self.directory, f'{key}.json'))
+
+    def _bodies(self):
+        return [os.path.join(self.directory, name)
+                for name in os.listdir(self.directory) if name.endswith('.html')]
+
+    def get(self, url):
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path) as fp:
+                meta = json.load(fp)
+            with open(body_path, encoding='utf-8') as fp:
+                body = fp.read()
+            # reads count as use for the least recently used eviction
+            os.utime(body_path)
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(url, body, meta.get('etag'), meta.get('last_modified'),
+                          meta.get('stored_at'))
+
+    def store(self, url, response):
+        body_path, meta_path = self._paths(url)
+        data = response.text.encode('utf-8')
+        meta = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'stored_at': time.time(),
+        }
+        with self._lock:
+            old_size = os.path.getsize(body_path) if os.path.exists(body_path) else 0
+            self._write(body_path, data)
+            self._write(meta_path, json.dumps(meta).encode())
+            self._size += len(data) - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def touch(self, url):
+        '''
+        Marks an entry as fresh again after the server confirmed it with a 304.
+        '''
+        entry = self.get(url)
+        if entry is None:
+            return
+        _, meta_path = self._paths(url)
+        meta = {'url': url, 'etag': entry.etag,
+                'last_modified': entry.last_modified, 'stored_at': time.time()}
+        self._write(meta_path, json.dumps(meta).encode())
+
+    def _write(self, path, data):
+        # write to a temporary file first so readers never see half an entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(data)
+        os.replace(tmp, path)
+
+    def _evict(self):
+        bodies = sorted(self._bodies(), key=os.path.getmtime)
+        while bodies and self._size > self.max_bytes:
+            body_path = bodies.pop(0)
+            self._size -= os.path.getsize(body_path)
+            os.remove(body_path)
+            meta_path = body_path[:-len('.html')] + '.json'
+            if os.path.exists(meta_path):
+                os.remove(meta_path)
+
+    def record(self, outcome):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def stats(self):
+        return {'hits': self.hits, 'revalidated': self.revalidated,
+                'misses': self.misses, 'bytes': self._size}
+
+
+def default_cache():
+    '''
+    The response cache configured in settings, or None when SCRAPER_HTTP_CACHE
+    is switched off.
+    '''
+    if not getattr(settings, 'SCRAPER_HTTP_CACHE', True):
+        return None
+    directory = getattr(settings, 'SCRAPER_CACHE_DIR',
+                        os.path.join(tempfile.gettempdir(), 'newsagg-http-cache'))
+    max_bytes = getattr(settings, 'SCRAPER_CACHE_MAX_BYTES', 200 * 1024 * 1024)
+    return ResponseCache(directory, max_bytes)
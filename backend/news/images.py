@@ -0,0 +1,171 @@
+import hashlib
+import logging
+import os
+import tempfile
+from io import BytesIO
+from urllib.parse import urlsplit
+
+import requests
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from . import metrics
+from .fetch import fetcher
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+}
+
+
+# bounding boxes of the derived sizes, the feed cards use `thumb`
+VARIANTS = {
+    'thumb': (480, 320),
+    'medium': (1200, 800),
+}
+
+FORMATS = {
+    'webp': ('WEBP', '.webp', {'quality': 75, 'method': 4}),
+    'jpeg': ('JPEG', '.jpg', {'quality': 80, 'optimize': True, 'progressive': True}),
+}
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+def _extension(url, content_type):
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in EXTENSIONS:
+        return EXTENSIONS[content_type]
+    ext = os.path.splitext(urlsplit(url).path)[1].lower()
+    return ext if ext in EXTENSIONS.values() or ext == '.jpeg' else '.jpg'
+
+
+def hashed_name(hexdigest, extension):
+    return f'posts_images/{hexdigest[:2]}/{hexdigest}{extension}'
+
+
+def _save_once(name, content):
+    '''
+    Saves `content` under `name` unless it is there. Names are derived from
+    content hashes, so when a concurrent writer got the name first, the copy
+    the storage saved under another name is a duplicate and is deleted.
+    '''
+    if default_storage.exists(name):
+        return name
+    saved = default_storage.save(name, content)
+    if saved != name:
+        default_storage.delete(saved)
+    return name
+
+
+def store_image(url, max_bytes=None):
+    '''
+    Streams the image at `url` to storage in chunks and returns its storage
+    name, or None when it could not be downloaded.
+
+    Images are named after the sha256 of their content, so the same photo
+    scraped from several articles or sources is stored once and shared.
+    Bodies over SCRAPER_MAX_IMAGE_BYTES are rejected without being read
+    to the end. Download, header and storage errors are logged and skip the
+    image.
+    '''
+    max_bytes = max_bytes or getattr(
+        settings, 'SCRAPER_MAX_IMAGE_BYTES', 10 * 1024 * 1024)
+    try:
+        with fetcher.get(url, stream=True) as response:
+            if response.status_code != requests.codes.ok:
+                return None
+            if int(response.headers.get('Content-Length') or 0) > max_bytes:
+                raise ImageTooLarge(url)
+
+            digest = hashlib.sha256()
+            size = 0
+            with tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE * 4) as tmp:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise ImageTooLarge(url)
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                metrics.DOWNLOAD_BYTES.inc(size, host=metrics.host_of(url), kind='image')
+
+                name = hashed_name(digest.hexdigest(),
+                                   _extension(url, response.headers.get('Content-Type')))
+                tmp.seek(0)
+                return _save_once(name, File(tmp))
+    # ValueError for a malformed Content-Length, OSError from the storage
+    except (requests.RequestException, ImageTooLarge, ValueError, OSError) as e:
+        logger.warning('Skipping image %s: %r', url, e, extra={
+            'event': 'image_skip', 'url': url, 'host': metrics.host_of(url)})
+        return None
+
+
+def render_variants(fp):
+    '''
+    Returns {size: {format: bytes}} with every VARIANTS size of the image in
+    `fp` encoded in every FORMATS format.
+    '''
+    rendered = {}
+    with Image.open(fp) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for size, box in VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail(box, Image.Resampling.LANCZOS)
+            for fmt, (pil_format, _, options) in FORMATS.items():
+                out = BytesIO()
+                resized.save(out, pil_format, **options)
+                rendered.setdefault(size, {})[fmt] = out.getvalue()
+    return rendered
+
+
+def variant_name(name, size, fmt):
+    base = os.path.splitext(name)[0]
+    return f"{base}_{size}{FORMATS[fmt][1]}"
+
+
+def ensure_variants(name):
+    '''
+    Generates the missing variants of the stored image `name` and returns
+    their storage names as {size: {format: name}}, or {} when the original
+    cannot be decoded. Variant names derive from the content hashed original,
+    so they never change once written.
+    '''
+    names = {size: {fmt: variant_name(name, size, fmt) for fmt in FORMATS}
+             for size in VARIANTS}
+    missing = [(size, fmt) for size, formats in names.items()
+               for fmt, variant in formats.items() if not default_storage.exists(variant)]
+    if not missing:
+        return names
+
+    try:
+        with default_storage.open(name) as fp:
+            rendered = render_variants(fp)
+        for size, fmt in missing:
+            _save_once(names[size][fmt], ContentFile(rendered[size][fmt]))
+    except (OSError, Image.DecompressionBombError) as e:
+        logger.warning('Could not render variants of %s: %r', name, e, extra={
+            'event': 'image_variants_failed', 'image': name})
+        return {}
+    return names
+
+
+def ingest_image(url):
+    '''
+    Stores the image at `url` and its variants, returning (name, variants),
+    or None when it could not be downloaded.
+    '''
+    name = store_image(url)
+    if name is None:
+        return None
+    return name, ensure_variants(name)
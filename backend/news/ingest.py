@@ -0,0 +1,129 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+
+from . import apicache, metrics, search, similarity
+from .dates import parse_published
+from .images import ingest_image
+from .models import News
+
+# fields refreshed when an article with the same url is scraped again
+UPSERT_FIELDS = ['title', 'summary', 'content', 'author', 'created', 'source',
+                 'source_key']
+
+
+class IngestResult:
+    def __init__(self, inserted=0, updated=0, skipped=0):
+        self.inserted = inserted
+        self.updated = updated
+        self.skipped = skipped
+        self.stage_seconds = {}
+
+    def __repr__(self):
+        return f'<IngestResult inserted={self.inserted} updated={self.updated} skipped={self.skipped}>'
+
+
+def persist_articles(articles, batch_size=None, timings=None):
+    '''
+    Writes scraped articles in batches, each batch as one upsert keyed on the
+    article url inside a single transaction, together with their postings in
+    the search index and their story clustering.
+
+    Images are downloaded on a thread pool while the text is being written, so
+    articles are committed without waiting on a slow image host. Their storage
+    names are attached afterwards in bulk updates. The cached API responses
+    are invalidated as every batch commits, so a feed reloaded on the news of
+    an article gets it, and once more when the images are attached.
+
+    Every article is a dict with the UPSERT_FIELDS, `url` and an optional
+    `image_url`; its `published_at` is parsed from `created`. Articles
+    without a url or title, and repeats of a url already in `articles`, are
+    skipped.
+
+    The seconds spent writing batches and downloading images are added to
+    `timings`, if given; images download concurrently, so theirs is the sum
+    over the pool.
+    '''
+    batch_size = batch_size or getattr(settings, 'SCRAPER_BATCH_SIZE', 100)
+    result = IngestResult()
+
+    seen = set()
+    valid = []
+    for article in articles:
+        url = article.get('url')
+        if not url or not article.get('title') or url in seen:
+            result.skipped += 1
+            continue
+        seen.add(url)
+        valid.append(article)
+
+    with ThreadPoolExecutor(max_workers=getattr(settings, 'SCRAPER_IMAGE_WORKERS', 8)) as pool:
+        downloads = {article['url']: pool.submit(_timed_image, article)
+                     for article in valid if article.get('image_url')}
+
+        for start in range(0, len(valid), batch_size):
+            batch = valid[start:start + batch_size]
+            with metrics.stage(batch[0].get('source_key', ''), 'write', timings):
+                _persist_batch(batch, result)
+
+        images = {}
+        for url, download in downloads.items():
+            images[url], seconds = download.result()
+            if timings is not None:
+                timings['image'] = timings.get('image', 0.0) + seconds
+
+    images = {url: image for url, image in images.items() if image}
+    if images:
+        _attach_images(images, batch_size)
+        apicache.bump_version()
+    return result
+
+
+def _timed_image(article):
+    # runs on the pool: returns the seconds instead of adding them to the
+    # caller's timings from several threads
+    start = time.perf_counter()
+    image = ingest_image(article['image_url'])
+    seconds = time.perf_counter() - start
+    source = article.get('source_key', '')
+    metrics.SCRAPE_STAGE_SECONDS.observe(seconds, source=source, stage='image')
+    if image is None:
+        metrics.SCRAPE_ERRORS.inc(source=source, stage='image')
+    return image, seconds
+
+
+def _persist_batch(batch, result):
+    urls = [article['url'] for article in batch]
+    rows = [News(url=article['url'], published_at=parse_published(article['created']),
+                 **{field: article[field] for field in UPSERT_FIELDS})
+            for article in batch]
+
+    with transaction.atomic():
+        existing = set(News.objects.filter(
+            url__in=urls).values_list('url', flat=True))
+        News.objects.bulk_create(rows, update_conflicts=True, unique_fields=['url'],
+                                 update_fields=UPSERT_FIELDS + ['published_at'])
+        # upserts do not report the ids of the rows they updated
+        ids = dict(News.objects.filter(url__in=urls).values_list('url', 'id'))
+        for row in rows:
+            row.id = ids[row.url]
+        search.index_news(rows)
+        similarity.cluster_news(rows)
+        transaction.on_commit(apicache.bump_version)
+
+    result.updated += len(existing)
+    result.inserted += len(batch) - len(existing)
+
+
+def _attach_images(images, batch_size):
+    '''
+    Points the rows keyed by url in `images` at their stored (name, variants).
+    '''
+    rows = list(News.objects.filter(url__in=images).only(
+        'id', 'url', 'image', 'image_variants'))
+    for news in rows:
+        news.image, news.image_variants = images[news.url]
+    News.objects.bulk_update(rows, ['image', 'image_variants'],
+                             batch_size=batch_size)
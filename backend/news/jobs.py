@@ -0,0 +1,143 @@
+import traceback
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import engine, metrics
+from .fetch import fetcher
+from .models import ScrapeJob
+from .sources import SOURCES
+
+DEFAULT_INTERVAL = 15 * 60
+DEFAULT_MIN_INTERVAL = 2 * 60
+
+
+def scrape_interval(source):
+    '''
+    Seconds between scheduled scrapes of `source`, configured through the
+    SCRAPE_INTERVALS setting ({'nagarik': 600, ...}).
+    '''
+    intervals = getattr(settings, 'SCRAPE_INTERVALS', {})
+    return intervals.get(source, getattr(settings, 'SCRAPE_DEFAULT_INTERVAL', DEFAULT_INTERVAL))
+
+
+def enqueue(source):
+    '''
+    Queues a scrape of `source` and returns it, or returns the job of the
+    source that is already queued or running. The one_active_job_per_source
+    constraint keeps concurrent callers, in any process, from both queueing.
+    '''
+    if source not in SOURCES:
+        raise KeyError(source)
+    while True:
+        try:
+            with transaction.atomic():
+                return ScrapeJob.objects.create(source=source)
+        except IntegrityError:
+            job = ScrapeJob.objects.filter(source=source, status__in=ScrapeJob.ACTIVE).first()
+            # None when it finished in between, then queueing succeeds
+            if job is not None:
+                return job
+
+
+def request_scrape(source, now=None):
+    '''
+    The job answering a request to scrape `source`: its last successful one
+    when that finished less than SCRAPE_MIN_INTERVAL seconds ago, otherwise
+    the active or a newly queued one.
+    '''
+    if source not in SOURCES:
+        raise KeyError(source)
+    now = now or timezone.now()
+    last = ScrapeJob.objects.filter(source=source, status=ScrapeJob.DONE).exclude(
+        finished_at=None).order_by('-finished_at').first()
+    min_interval = getattr(settings, 'SCRAPE_MIN_INTERVAL', DEFAULT_MIN_INTERVAL)
+    if last is not None and (now - last.finished_at).total_seconds() < min_interval:
+        return last
+    return enqueue(source)
+
+
+def claim_next_job(sources=None, worker=''):
+    '''
+    Marks the oldest queued job, of one of `sources` when given, as running by
+    `worker` and returns it. The status check in the update makes sure two
+    workers never claim the same job.
+    '''
+    queued = ScrapeJob.objects.filter(status=ScrapeJob.QUEUED)
+    if sources is not None:
+        queued = queued.filter(source__in=sources)
+    while True:
+        job = queued.order_by('created_at').first()
+        if job is None:
+            return None
+        claimed = ScrapeJob.objects.filter(id=job.id, status=ScrapeJob.QUEUED).update(
+            status=ScrapeJob.RUNNING, started_at=timezone.now(), worker=worker)
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def run_job(job):
+    def progress(stage):
+        job.stage = stage
+        job.save(update_fields=['stage'])
+
+    timings = {}
+    try:
+        result = engine.scrape(SOURCES[job.source], progress, timings)
+        job.items_inserted = result.inserted
+        job.items_updated = result.updated
+        job.items_skipped = result.skipped
+        job.status = ScrapeJob.DONE
+        job.stage = ''
+    except Exception:
+        job.status = ScrapeJob.FAILED
+        job.error = traceback.format_exc()
+    job.finished_at = timezone.now()
+    job.fetch_stats = fetcher.stats()
+    job.stage_seconds = {stage: round(seconds, 4) for stage, seconds in timings.items()}
+    job.save(update_fields=['status', 'stage', 'items_inserted', 'items_updated',
+                            'items_skipped', 'error', 'fetch_stats', 'stage_seconds',
+                            'finished_at'])
+    metrics.SCRAPE_JOBS.inc(source=job.source, status=job.status)
+    if job.duration is not None:
+        metrics.SCRAPE_JOB_SECONDS.observe(job.duration, source=job.source)
+    return job
+
+
+def schedule_due_sources(now=None, sources=None):
+    '''
+    Queues a job for every source, or every one of `sources`, whose latest job
+    is older than its interval and that has nothing queued or running already.
+    '''
+    now = now or timezone.now()
+    queued = []
+    for source in (SOURCES if sources is None else sources):
+        last = ScrapeJob.objects.filter(
+            source=source).order_by('-created_at').first()
+        if last is not None:
+            if last.status in ScrapeJob.ACTIVE:
+                continue
+            if (now - last.created_at).total_seconds() < scrape_interval(source):
+                continue
+        queued.append(enqueue(source))
+    return queued
+
+
+def run_pending_jobs(coordinator=None):
+    '''
+    Runs queued jobs until none is left, only those of the sources leased to
+    `coordinator` when one is given.
+    '''
+    def claim():
+        if coordinator is None:
+            return claim_next_job()
+        return claim_next_job(coordinator.sources, coordinator.name)
+
+    ran = []
+    job = claim()
+    while job is not None:
+        ran.append(run_job(job))
+        job = claim()
+    return ran
@@ -0,0 +1,175 @@
+import logging
+import math
+import os
+import random
+import socket
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ScrapeJob, ScrapeWorker, SourceLease
+from .sources import SOURCES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 60
+
+
+class Coordinator:
+    '''
+    Shares the sources between the live scrape workers through SourceLease
+    rows, so every source is scraped by one worker at a time and the work is
+    spread over all of them.
+
+    Every heartbeat() marks the worker alive, renews its leases and balances
+    them: a worker holds at most its fair share, the sources divided by the
+    live workers rounded up. It takes free and expired leases up to that share
+    and lets go of the ones above it that are not being scraped, which newly
+    started workers then pick up. A worker that stops renewing loses its
+    leases after SCRAPE_LEASE_TTL seconds; whoever takes one over fails the
+    job the dead worker left running, so the source is scheduled again. A
+    worker restarted under its old name fails its old jobs when it registers.
+    '''
+
+    def __init__(self, name=None, ttl=None, sources=None):
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.ttl = timedelta(seconds=ttl or getattr(settings, 'SCRAPE_LEASE_TTL', DEFAULT_TTL))
+        self.all_sources = list(sources or SOURCES)
+        self.sources = set()
+        self._registered = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def heartbeat(self, now=None):
+        '''
+        Renews and balances the leases of this worker and returns the set of
+        sources it holds.
+        '''
+        now = now or timezone.now()
+        # single statements throughout: on SQLite, a transaction that reads
+        # before it writes fails at once when another one does the same
+        if not ScrapeWorker.objects.filter(name=self.name).update(heartbeat_at=now):
+            self._registered = False
+            try:
+                with transaction.atomic():
+                    ScrapeWorker.objects.create(name=self.name, heartbeat_at=now)
+            except IntegrityError:
+                pass
+        if not self._registered:
+            self.fail_stale_jobs(now)
+            self._registered = True
+        # workers silent for ten lease times are gone for good
+        ScrapeWorker.objects.filter(heartbeat_at__lt=now - 10 * self.ttl).delete()
+
+        held = self.renew(now)
+        live = ScrapeWorker.objects.filter(heartbeat_at__gt=now - self.ttl).count()
+        share = math.ceil(len(self.all_sources) / max(live, 1))
+
+        if len(held) > share:
+            running = set(ScrapeJob.objects.filter(
+                worker=self.name, status=ScrapeJob.RUNNING).values_list('source', flat=True))
+            surplus = sorted(held - running)[:len(held) - share]
+            SourceLease.objects.filter(owner=self.name, source__in=surplus).delete()
+            held -= set(surplus)
+        elif len(held) < share:
+            taken = set(SourceLease.objects.filter(expires_at__gt=now).values_list('source', flat=True))
+            free = [source for source in self.all_sources if source not in taken]
+            # workers starting together should not all go for the same source first
+            random.shuffle(free)
+            for source in free:
+                if len(held) >= share:
+                    break
+                if self.acquire(source, now):
+                    held.add(source)
+
+        self.sources = held
+        return held
+
+    def fail_stale_jobs(self, now):
+        '''
+        Fails the jobs left running under this worker's name by an earlier
+        run of it, such as one restarted with the same --name after a crash.
+        Takeovers do not fail them, as the lease may still be this worker's.
+        '''
+        stale = ScrapeJob.objects.filter(worker=self.name, status=ScrapeJob.RUNNING).update(
+            status=ScrapeJob.FAILED, finished_at=now, error='Worker restarted during the job.')
+        if stale:
+            logger.warning('Failed %d jobs left running by %s', stale, self.name, extra={
+                'event': 'stale_jobs', 'worker': self.name, 'jobs': stale})
+        return stale
+
+    def renew(self, now=None):
+        '''
+        Extends the unexpired leases of this worker and returns their sources.
+        '''
+        now = now or timezone.now()
+        leases = SourceLease.objects.filter(owner=self.name, expires_at__gt=now)
+        leases.update(expires_at=now + self.ttl)
+        return set(leases.values_list('source', flat=True))
+
+    def acquire(self, source, now):
+        '''
+        Takes the lease of `source` when it is free or expired.
+        '''
+        expires_at = now + self.ttl
+        previous = SourceLease.objects.filter(source=source).values_list('owner', flat=True).first()
+        # the condition makes the update the lock: of the workers taking an
+        # expired lease at once, one matches the row
+        taken = SourceLease.objects.filter(source=source).filter(
+            Q(expires_at__lte=now) | Q(owner=self.name)).update(
+            owner=self.name, acquired_at=now, expires_at=expires_at)
+        if not taken:
+            if previous is not None:
+                return False
+            try:
+                with transaction.atomic():
+                    SourceLease.objects.create(source=source, owner=self.name,
+                                               acquired_at=now, expires_at=expires_at)
+            except IntegrityError:
+                # another worker created it first
+                return False
+
+        orphaned = ScrapeJob.objects.filter(source=source, status=ScrapeJob.RUNNING).exclude(
+            worker=self.name).update(status=ScrapeJob.FAILED, finished_at=now,
+                                     error=f'Worker lost its lease of {source}.')
+        if previous not in (None, self.name):
+            logger.warning('Took over %s from %s', source, previous, extra={
+                'event': 'lease_takeover', 'source': source, 'worker': self.name,
+                'previous': previous, 'orphaned_jobs': orphaned})
+        return True
+
+    def release(self):
+        '''
+        Gives up every lease of this worker, for a clean shutdown.
+        '''
+        SourceLease.objects.filter(owner=self.name).delete()
+        ScrapeWorker.objects.filter(name=self.name).delete()
+        self.sources = set()
+
+    def start(self):
+        '''
+        Keeps the leases renewed from a daemon thread, also while a long
+        scrape holds up the worker loop.
+        '''
+        self._thread = threading.Thread(target=self._keep_alive, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.release()
+
+    def _keep_alive(self):
+        while not self._stop.wait(self.ttl.total_seconds() / 3):
+            try:
+                close_old_connections()
+                ScrapeWorker.objects.filter(name=self.name).update(heartbeat_at=timezone.now())
+                self.renew()
+            except Exception:
+                logger.exception('Renewing the leases of %s failed', self.name)
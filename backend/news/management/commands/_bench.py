@@ -0,0 +1,41 @@
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.test import override_settings
+
+
+@contextmanager
+def scratch_database():
+    '''
+    Runs the block against a fresh test database, so benchmarks never touch
+    the real data, and drops it afterwards.
+    '''
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def uncached():
+    '''
+    Turns the API response cache off, so the requests of a benchmark render
+    every time instead of timing cache hits.
+    '''
+    return override_settings(NEWS_CACHE='bench', CACHES={
+        **settings.CACHES, 'bench': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+
+
+def best_of(func, repeat=5):
+    '''
+    Fastest wall time of `repeat` calls of `func`, in milliseconds.
+    '''
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from news.apicache import bump_version
+from news.dates import parse_published
+from news.models import News
+
+
+class Command(BaseCommand):
+    help = 'Parses the printed publication time of stored articles into published_at.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--all', action='store_true',
+                            help='Reparse rows that already have a published_at.')
+
+    def handle(self, *args, **options):
+        queryset = News.objects.all() if options['all'] else News.objects.filter(published_at=None)
+        last_id = 0
+        parsed = unparsed = 0
+        while True:
+            # walk the primary key so every batch is an index range scan
+            rows = list(queryset.filter(id__gt=last_id).order_by('id')
+                        .only('id', 'created', 'ingested_at', 'published_at')[:options['batch_size']])
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            changed = []
+            for news in rows:
+                # relative times count back from when the row was scraped
+                published_at = parse_published(news.created, news.ingested_at)
+                if published_at is None:
+                    unparsed += 1
+                elif published_at != news.published_at:
+                    news.published_at = published_at
+                    changed.append(news)
+            with transaction.atomic():
+                News.objects.bulk_update(changed, ['published_at'])
+            parsed += len(changed)
+            self.stdout.write(f'{parsed} parsed, {unparsed} left unparsed')
+
+        if parsed:
+            bump_version()
@@ -0,0 +1,56 @@
+import asyncio
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from news.events import EVENTS_PATH, event_stream, get_broadcaster
+
+
+class Command(BaseCommand):
+    help = 'Measures the memory of idle event stream clients and the fan-out time of one article.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=5000)
+
+    async def run(self, clients):
+        broadcaster = get_broadcaster()
+        disconnect = asyncio.Event()
+        received = asyncio.Semaphore(0)
+
+        async def receive():
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message.get('body', b'').startswith(b'id:'):
+                received.release()
+
+        scope = {'type': 'http', 'path': EVENTS_PATH, 'query_string': b'', 'headers': []}
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        tasks = [asyncio.ensure_future(event_stream(scope, receive, send)) for _ in range(clients)]
+        while len(broadcaster.listeners) < clients:
+            await asyncio.sleep(0.01)
+        per_client = (tracemalloc.get_traced_memory()[0] - before) / clients
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        broadcaster.publish({'id': 1, 'source': 'nagarik', 'title': 'title', 'published_at': None})
+        for _ in range(clients):
+            await received.acquire()
+        fan_out = (time.perf_counter() - start) * 1000
+
+        disconnect.set()
+        await asyncio.gather(*tasks)
+        return per_client, fan_out
+
+    def handle(self, *args, **options):
+        clients = options['clients']
+        # published by hand instead of polled, so only the streams are measured
+        with override_settings(NEWS_EVENTS_BROADCASTER='news.events.LocalBroadcaster'):
+            per_client, fan_out = asyncio.run(self.run(clients))
+        self.stdout.write(f'{clients:,} idle clients: {per_client / 1024:.1f} KiB each, '
+                          f'one article reaches all of them in {fan_out:.1f} ms')
+
@@ -0,0 +1,82 @@
+import gzip
+import hashlib
+import tempfile
+from io import BytesIO
+from urllib.parse import unquote, urlsplit
+
+from PIL import Image
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from news.images import ensure_variants, hashed_name
+from news.models import News
+
+from ._bench import scratch_database, uncached
+
+
+def synthetic_photo(seed, size=(1600, 1067)):
+    '''
+    A noisy gradient JPEG of roughly the size and entropy of a news photo.
+    '''
+    gradient = Image.linear_gradient('L').resize(size)
+    noise = Image.effect_noise(size, 40 + seed % 20)
+    image = Image.merge('RGB', (gradient, noise, gradient.rotate(90 + seed)))
+    out = BytesIO()
+    image.save(out, 'JPEG', quality=90)
+    return out.getvalue()
+
+
+def storage_name(url):
+    return unquote(urlsplit(url).path)[len(settings.MEDIA_URL):]
+
+
+class Command(BaseCommand):
+    help = ('Measures the bytes of a newslist/ page: its JSON and the thumbnails it '
+            'references, against the originals the cards would show without variants.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=50)
+        parser.add_argument('--from-db', action='store_true',
+                            help='Measure the feed of the stored articles instead of synthetic ones.')
+
+    def fill(self, items):
+        '''
+        Stores `items` articles with synthetic photos the way ingest does.
+        '''
+        for i in range(items):
+            data = synthetic_photo(i)
+            name = default_storage.save(hashed_name(hashlib.sha256(data).hexdigest(), '.jpg'),
+                                        ContentFile(data))
+            News.objects.create(
+                title=f'Title {i}', summary='summary ' * 20, content='content ' * 200,
+                author='author', created='', source='Ekantipur', source_key='ekantipur',
+                url=f'https://example.com/news/{i}', image=name,
+                image_variants=ensure_variants(name))
+
+    def measure(self, items):
+        response = APIClient().get('/api/news/newslist/', {'page_size': items})
+        results = response.json()['results']
+        thumbnails = sum(default_storage.size(storage_name(item['thumbnail']))
+                         for item in results if item['thumbnail'])
+        originals = sum(default_storage.size(name) for name in News.objects.filter(
+            id__in=[item['id'] for item in results]).exclude(image='').values_list('image', flat=True))
+
+        self.stdout.write(f'{len(results)}-item feed page:')
+        self.stdout.write(f'  {"JSON":<12}{len(response.content):>12,} bytes '
+                          f'({len(gzip.compress(response.content)):,} gzipped)')
+        self.stdout.write(f'  {"thumbnails":<12}{thumbnails:>12,} bytes')
+        ratio = f', {originals / thumbnails:.1f}x the thumbnails' if thumbnails else ''
+        self.stdout.write(f'  {"originals":<12}{originals:>12,} bytes{ratio}')
+
+    def handle(self, *args, **options):
+        with uncached():
+            if options['from_db']:
+                return self.measure(options['items'])
+            with scratch_database(), tempfile.TemporaryDirectory() as media, \
+                    override_settings(MEDIA_ROOT=media):
+                self.fill(options['items'])
+                self.measure(options['items'])
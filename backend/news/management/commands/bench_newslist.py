@@ -0,0 +1,71 @@
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from news.models import News
+
+from ._bench import best_of, scratch_database, uncached
+
+SOURCES = ['Ekantipur', 'Onlinekhabar', 'Nagarik News']
+
+
+class Command(BaseCommand):
+    help = 'Measures newslist/ latency for the first and a deep page as the News table grows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--steps', type=int, default=3,
+                            help='Number of table sizes, growing tenfold up to --rows.')
+        parser.add_argument('--depth', type=int, default=20,
+                            help='Page number of the deep page, reached by following cursors.')
+
+    def fill(self, count, start, total):
+        '''
+        Adds `count` rows with ingest times spread evenly over the last 60 days
+        of a `total` row table, so the 3 day window holds about 5% of them.
+        '''
+        now = timezone.now()
+        step = timedelta(days=60) / total
+        field = News._meta.get_field('ingested_at')
+        field.auto_now_add = False
+        try:
+            batch = []
+            for i in range(start, start + count):
+                batch.append(News(
+                    title=f'Title {i}', summary='summary', content='content ' * 50,
+                    author='author', created='', source=random.choice(SOURCES),
+                    url=f'https://example.com/news/{i}', ingested_at=now - step * (total - i)))
+                if len(batch) == 10_000:
+                    News.objects.bulk_create(batch)
+                    batch = []
+            News.objects.bulk_create(batch)
+        finally:
+            field.auto_now_add = True
+
+    def handle(self, *args, **options):
+        sizes = [options['rows'] // 10 ** i for i in reversed(range(options['steps']))]
+        client = APIClient()
+
+        def first_page():
+            return client.get('/api/news/newslist/').json()
+
+        def deep_page():
+            page = first_page()
+            for _ in range(options['depth'] - 1):
+                if page['next'] is None:
+                    break
+                page = client.get(page['next']).json()
+            return page
+
+        with scratch_database(), uncached():
+            self.stdout.write(f"{'rows':>10}{'first page ms':>16}{'cursor step ms':>16}")
+            for size in sizes:
+                # rebuild the table at every size so the window keeps its share
+                News.objects.all().delete()
+                self.fill(size, 0, size)
+                first = best_of(first_page)
+                step = (best_of(deep_page, repeat=3) - first) / (options['depth'] - 1)
+                self.stdout.write(f'{size:>10,}{first:>16.1f}{step:>16.1f}')
@@ -0,0 +1,55 @@
+import os
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from news.engine import parse_detail, parse_listing
+from news.parsing import available_backends
+from news.sources import SOURCES
+
+TESTDATA = os.path.join(os.path.dirname(__file__), '..', '..', 'testdata')
+
+
+def read_page(name):
+    with open(os.path.join(TESTDATA, name), encoding='utf-8') as fp:
+        return fp.read()
+
+
+class Command(BaseCommand):
+    help = 'Measures parse time and peak memory of the saved source pages for every parser backend.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def measure(self, parse, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            parse()
+        elapsed = (time.perf_counter() - start) / repeat
+
+        tracemalloc.start()
+        parse()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return elapsed, peak
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'page':<24}{'backend':<13}{'mode':<8}{'ms/parse':>10}{'peak KiB':>10}")
+        for key, spec in SOURCES.items():
+            home = read_page(f'{key}_home.html')
+            article = read_page(f'{key}_article.html')
+            listing = parse_listing(spec, home, 'html.parser', False)[0]
+            pages = {
+                f'{key} home': lambda backend, scoped: parse_listing(spec, home, backend, scoped),
+                f'{key} article': lambda backend, scoped: parse_detail(spec, listing, article, backend, scoped),
+            }
+            for page, parse in pages.items():
+                for backend in available_backends():
+                    for scoped in (False, True):
+                        elapsed, peak = self.measure(
+                            lambda: parse(backend, scoped), options['repeat'])
+                        self.stdout.write(
+                            f"{page:<24}{backend:<13}{'subtree' if scoped else 'full':<8}"
+                            f"{elapsed * 1000:>10.2f}{peak / 1024:>10.0f}")
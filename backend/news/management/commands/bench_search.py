@@ -0,0 +1,76 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+
+from news.models import News, SearchPosting
+from news.search import index_news
+
+from ._bench import best_of, scratch_database, uncached
+
+SOURCES = ['Ekantipur', 'Onlinekhabar', 'Nagarik News']
+CONSONANTS = 'कखगघचछजझटठडढतथदधनपफबभमयरलवशसह'
+VOWEL_SIGNS = ['', 'ा', 'ि', 'ी', 'ु', 'ू', 'े', 'ो']
+
+# a word in about a third of the articles, one in a few hundred, and both
+QUERIES = ['नेपाल', 'निर्वाचन', 'नेपाल निर्वाचन']
+RATES = {'नेपाल': 0.3, 'निर्वाचन': 0.003}
+
+
+def synthetic_word(rng):
+    return ''.join(rng.choice(CONSONANTS) + rng.choice(VOWEL_SIGNS)
+                   for _ in range(rng.randint(2, 4)))
+
+
+class Command(BaseCommand):
+    help = 'Compares search latency of the full-text index with the icontains SearchFilter of newslist/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000)
+        parser.add_argument('--steps', type=int, default=2,
+                            help='Number of table sizes, growing tenfold up to --rows.')
+        parser.add_argument('--words', type=int, default=80,
+                            help='Words of content per article.')
+
+    def fill(self, count, words):
+        rng = random.Random(count)
+        vocabulary = [synthetic_word(rng) for _ in range(5000)]
+        for start in range(0, count, 5000):
+            batch = []
+            for i in range(start, min(start + 5000, count)):
+                text = rng.choices(vocabulary, k=words)
+                for word, rate in RATES.items():
+                    if rng.random() < rate:
+                        text[rng.randrange(words)] = word
+                batch.append(News(
+                    title=' '.join(text[:8]), summary=' '.join(text[8:30]),
+                    content=' '.join(text), author='author', created='',
+                    source=rng.choice(SOURCES), url=f'https://example.com/news/{i}'))
+            News.objects.bulk_create(batch)
+            index_news(News.objects.filter(url__in=[news.url for news in batch])
+                       .only('id', 'title', 'summary', 'content'))
+
+    def handle(self, *args, **options):
+        sizes = [options['rows'] // 10 ** i for i in reversed(range(options['steps']))]
+        client = APIClient()
+
+        with scratch_database(), uncached():
+            self.stdout.write(
+                f"{'rows':>10}{'query':>18}{'hits':>8}{'icontains ms':>14}{'index ms':>10}")
+            for size in sizes:
+                News.objects.all().delete()
+                start = time.perf_counter()
+                self.fill(size, options['words'])
+                self.stderr.write(
+                    f'{size:,} rows and {SearchPosting.objects.count():,} postings '
+                    f'written in {time.perf_counter() - start:.0f}s')
+
+                for query in QUERIES:
+                    hits = client.get('/api/news/search/', {'q': query}).json()['count']
+                    icontains = best_of(lambda: client.get(
+                        '/api/news/newslist/', {'search': query}).json())
+                    indexed = best_of(lambda: client.get(
+                        '/api/news/search/', {'q': query}).json())
+                    self.stdout.write(
+                        f'{size:>10,}{query:>18}{hits:>8,}{icontains:>14.1f}{indexed:>10.1f}')
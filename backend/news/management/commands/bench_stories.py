@@ -0,0 +1,84 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from news.models import News
+from news.similarity import cluster_news, shingles, signature, similarity
+
+from ._bench import scratch_database
+from .bench_search import synthetic_word
+
+SOURCES = ['ekantipur', 'onlinekhabar', 'nagarik']
+
+
+class Command(BaseCommand):
+    help = 'Measures the per-article cost of story matching at ingest as the corpus grows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000)
+        parser.add_argument('--steps', type=int, default=3,
+                            help='Number of corpus sizes, growing tenfold up to --rows.')
+        parser.add_argument('--batch', type=int, default=100,
+                            help='Articles ingested at every size, half of them rewrites of stored ones.')
+
+    def articles(self, rng, vocabulary, count, start):
+        rows = []
+        for i in range(start, start + count):
+            words = rng.choices(vocabulary, k=60)
+            rows.append(News(title=' '.join(words[:8]), summary='', content=' '.join(words),
+                             author='', created='', source=rng.choice(SOURCES),
+                             url=f'https://example.com/news/{i}'))
+        return rows
+
+    def rewrite(self, rng, vocabulary, news, i):
+        # another source's take: a fifth of the words changed
+        words = news.content.split()
+        for j in rng.sample(range(len(words)), len(words) // 5):
+            words[j] = rng.choice(vocabulary)
+        return News(title=news.title, summary='', content=' '.join(words), author='',
+                    created='', source='nagarik', url=f'https://example.com/rewrite/{i}')
+
+    def insert(self, rows):
+        News.objects.bulk_create(rows)
+        stored = list(News.objects.filter(url__in=[news.url for news in rows])
+                      .only('id', 'title', 'content'))
+        with transaction.atomic():
+            cluster_news(stored)
+        return stored
+
+    def handle(self, *args, **options):
+        rng = random.Random(1)
+        vocabulary = [synthetic_word(rng) for _ in range(20_000)]
+        sizes = [options['rows'] // 10 ** i for i in reversed(range(options['steps']))]
+        batch = options['batch']
+
+        with scratch_database():
+            self.stdout.write(f"{'rows':>10}{'LSH ms/article':>16}{'matched':>9}"
+                              f"{'brute force ms/article':>24}")
+            stored = 0
+            for size in sizes:
+                for start in range(stored, size, 1000):
+                    self.insert(self.articles(rng, vocabulary, min(1000, size - start), start))
+                stored = size
+
+                originals = list(News.objects.order_by('?').only('title', 'content')[:batch // 2])
+                incoming = self.articles(rng, vocabulary, batch - len(originals), 10 ** 9 + size)
+                incoming += [self.rewrite(rng, vocabulary, news, size * 10 + i)
+                             for i, news in enumerate(originals)]
+
+                begin = time.perf_counter()
+                inserted = self.insert(incoming)
+                lsh = (time.perf_counter() - begin) * 1000 / len(incoming)
+                matched = sum(news.story_id is not None for news in inserted)
+                stored += len(incoming)
+
+                # the linear alternative: compare one article with every stored signature
+                begin = time.perf_counter()
+                probe = signature(shingles(incoming[-1]))
+                for other in News.objects.values_list('signature', flat=True).iterator():
+                    similarity(probe, other)
+                brute = (time.perf_counter() - begin) * 1000
+
+                self.stdout.write(f'{size:>10,}{lsh:>16.2f}{matched:>9}{brute:>24.1f}')
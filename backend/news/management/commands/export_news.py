@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from news.dates import parse_iso
+from news.export import FORMATS, export_rows
+
+
+class Command(BaseCommand):
+    help = 'Streams stored articles as NDJSON or CSV, for loading into analytics.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(FORMATS), default='ndjson')
+        parser.add_argument('--output', help='File to write, standard output by default.')
+        parser.add_argument('--source', help='Source key, e.g. ekantipur.')
+        parser.add_argument('--published-after', help='ISO 8601 date or time.')
+        parser.add_argument('--published-before', help='ISO 8601 date or time.')
+        parser.add_argument('--after', type=int, default=0,
+                            help='Resume after this article id, the last one a previous run wrote.')
+        parser.add_argument('--chunk-size', type=int)
+
+    def handle(self, *args, **options):
+        try:
+            published_after, published_before = (
+                parse_iso(options[name]) if options[name] else None
+                for name in ('published_after', 'published_before'))
+        except ValueError as e:
+            raise CommandError(e)
+
+        rows = export_rows(options['source'], published_after, published_before,
+                           options['after'], options['chunk_size'])
+        lines, _ = FORMATS[options['format']]
+        if not options['output']:
+            for line in lines(rows):
+                self.stdout.write(line, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as out:
+            out.writelines(lines(rows))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from news.apicache import bump_version
+from news.models import News
+from news.search import index_news
+
+
+class Command(BaseCommand):
+    help = 'Indexes every stored article for search, for rows saved before the index existed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        last_id = 0
+        indexed = 0
+        while True:
+            # walk the primary key so every batch is an index range scan
+            rows = list(News.objects.filter(id__gt=last_id).order_by('id')
+                        .only('id', 'title', 'summary', 'content')[:options['batch_size']])
+            if not rows:
+                break
+            with transaction.atomic():
+                index_news(rows)
+            last_id = rows[-1].id
+            indexed += len(rows)
+            self.stdout.write(f'{indexed} articles indexed')
+        bump_version()
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from news import jobs, metrics
+from news.leases import Coordinator
+
+
+class Command(BaseCommand):
+    help = ('Runs queued scrape jobs and schedules each source on its interval, '
+            'for the sources leased to this worker.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Schedule and run due jobs once, then exit.')
+        parser.add_argument('--poll', type=float, default=5,
+                            help='Seconds to wait between checks for new jobs.')
+        parser.add_argument('--no-schedule', action='store_true',
+                            help='Only run jobs queued through the API.')
+        parser.add_argument('--metrics-port', type=int,
+                            help='Serve the scrape metrics of this worker on this port.')
+        parser.add_argument('--name',
+                            help='Name of this worker in the source leases, unique by default.')
+
+    def handle(self, *args, **options):
+        if options['metrics_port']:
+            metrics.serve(options['metrics_port'])
+        coordinator = Coordinator(options['name'])
+        coordinator.start()
+        try:
+            while True:
+                sources = coordinator.heartbeat()
+                if not options['no_schedule']:
+                    jobs.schedule_due_sources(sources=sources)
+                for job in jobs.run_pending_jobs(coordinator):
+                    self.stdout.write(
+                        f'{job.source}: {job.status}, {job.items_inserted} inserted '
+                        f'in {job.duration:.1f}s')
+                if options['once']:
+                    return
+                time.sleep(options['poll'])
+        finally:
+            coordinator.stop()
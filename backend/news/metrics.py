@@ -0,0 +1,198 @@
+import json
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+REGISTRY = []
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    # full precision: a rounded counter stops moving between scrapes
+    if isinstance(value, float):
+        return '+Inf' if value == math.inf else repr(value)
+    return str(value)
+
+
+class Metric:
+    '''
+    A metric of this process, exported in the Prometheus text format. Values
+    are kept per combination of `labels`, given as keyword arguments.
+    '''
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _format_labels(self, key, **extra):
+        pairs = list(zip(self.labels, key)) + list(extra.items())
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(f'{name}{labels} {_number(value)}' for name, labels, value in self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [(self.name, self._format_labels(key), value) for key, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+    BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, observations = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [count + (value <= bound) for count, bound in zip(counts, self.buckets)]
+            self._values[key] = (counts, total + value, observations + 1)
+
+    def count(self, **labels):
+        return self._values.get(self._key(labels), (None, 0.0, 0))[2]
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        samples = []
+        for key, (counts, total, observations) in sorted(values.items()):
+            for bound, count in zip(self.buckets, counts):
+                samples.append((f'{self.name}_bucket', self._format_labels(key, le=_number(bound)), count))
+            samples.append((f'{self.name}_bucket', self._format_labels(key, le='+Inf'), observations))
+            samples.append((f'{self.name}_sum', self._format_labels(key), total))
+            samples.append((f'{self.name}_count', self._format_labels(key), observations))
+        return samples
+
+
+def render():
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+def host_of(url):
+    return urlsplit(url).netloc
+
+
+SCRAPE_STAGE_SECONDS = Histogram(
+    'newsagg_scrape_stage_seconds', 'Time spent in each stage of a scrape.',
+    ['source', 'stage'])
+SCRAPE_ARTICLES = Counter(
+    'newsagg_scrape_articles_total', 'Scraped articles by what became of them.',
+    ['source', 'outcome'])
+SCRAPE_ERRORS = Counter(
+    'newsagg_scrape_errors_total', 'Pages, articles and images a scrape had to skip, by stage.',
+    ['source', 'stage'])
+SCRAPE_JOBS = Counter(
+    'newsagg_scrape_jobs_total', 'Finished scrape jobs by outcome.', ['source', 'status'])
+DOWNLOAD_BYTES = Counter(
+    'newsagg_download_bytes_total', 'Bytes downloaded from the network, cache hits excluded.',
+    ['host', 'kind'])
+FETCH_RETRIES = Counter(
+    'newsagg_fetch_retries_total', 'Fetch attempts that were retried.', ['host'])
+FETCH_FAILURES = Counter(
+    'newsagg_fetch_failures_total', 'Fetches given up after their retries or on an open circuit.',
+    ['host'])
+SCRAPE_JOB_SECONDS = Histogram(
+    'newsagg_scrape_job_seconds', 'Wall time of scrape jobs.', ['source'])
+
+
+@contextmanager
+def stage(source, name, timings=None):
+    '''
+    Times the block as scrape stage `name` of `source`, adding the seconds to
+    `timings[name]` when a dict is given. A stage entered several times, like
+    the parsing of every detail page, adds up in `timings`.
+    '''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        SCRAPE_STAGE_SECONDS.observe(seconds, source=source, stage=name)
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + seconds
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    '''
+    Serves render() on every path, for processes without a web server.
+    '''
+
+    def do_GET(self):
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, address=''):
+    '''
+    Serves the metrics of this process on `port` from a daemon thread.
+    '''
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    '''
+    Formats records as one JSON object per line, with the `extra` fields of
+    the logging call as keys, e.g. {"event": "stage", "source": ...}.
+    '''
+
+    def format(self, record):
+        entry = {'time': self.formatTime(record), 'level': record.levelname,
+                 'logger': record.name, 'message': record.getMessage()}
+        entry.update({key: value for key, value in vars(record).items()
+                      if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.2 on 2026-10-18 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0002_scrapejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='news',
+            name='url',
+            field=models.URLField(blank=True, max_length=500, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.2 on 2026-10-18 17:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0003_news_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scrapejob',
+            name='items_skipped',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scrapejob',
+            name='items_updated',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
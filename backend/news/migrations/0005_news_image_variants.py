@@ -0,0 +1,18 @@
+# Generated by Django 4.1.2 on 2026-10-18 17:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0004_scrapejob_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='news',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
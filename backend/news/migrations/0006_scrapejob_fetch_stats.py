@@ -0,0 +1,18 @@
+# Generated by Django 4.1.2 on 2026-10-18 17:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0005_news_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scrapejob',
+            name='fetch_stats',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,31 @@
+import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_ingested_at(apps, schema_editor):
+    # older rows only know their ingest date, use midnight of that day
+    News = apps.get_model('news', 'News')
+    for news in News.objects.exclude(created_ad=None).only('id', 'created_ad').iterator():
+        ingested_at = datetime.datetime.combine(news.created_ad, datetime.time())
+        news.ingested_at = timezone.make_aware(ingested_at) if settings.USE_TZ else ingested_at
+        news.save(update_fields=['ingested_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0006_scrapejob_fetch_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='news',
+            name='ingested_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_ingested_at, migrations.RunPython.noop),
+    ]
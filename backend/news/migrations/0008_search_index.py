@@ -0,0 +1,32 @@
+# Generated by Django 4.1.2 on 2026-10-18 18:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0007_news_ingested_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='news',
+            name='search_length',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('frequency', models.PositiveIntegerField()),
+                ('news', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='news.news')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='searchposting',
+            constraint=models.UniqueConstraint(fields=('term', 'news'), name='unique_posting'),
+        ),
+    ]
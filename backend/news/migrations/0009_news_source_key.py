@@ -0,0 +1,36 @@
+# Generated by Django 4.1.2 on 2026-10-18 18:12
+
+from django.db import migrations, models
+
+# the display names the scrapers have stored in News.source, by source key
+SOURCE_NAMES = {
+    'ekantipur': 'Ekantipur',
+    'onlinekhabar': 'Onlinekhabar',
+    'nagarik': 'Nagarik News',
+}
+
+
+def backfill_source_key(apps, schema_editor):
+    News = apps.get_model('news', 'News')
+    for key, name in SOURCE_NAMES.items():
+        News.objects.filter(source=name).update(source_key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0008_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='news',
+            name='source_key',
+            field=models.SlugField(blank=True, db_index=False),
+        ),
+        migrations.RunPython(backfill_source_key, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['source_key', 'ingested_at'], name='news_news_source__5c2c61_idx'),
+        ),
+    ]
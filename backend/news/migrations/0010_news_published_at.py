@@ -0,0 +1,22 @@
+# Generated by Django 4.1.2 on 2026-10-18 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0009_news_source_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='news',
+            name='published_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['source_key', 'published_at'], name='news_news_source__2ad0e3_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.1.2 on 2026-10-18 18:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0010_news_published_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Story',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='news',
+            name='signature',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.CreateModel(
+            name='SimilarityBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField(db_index=True)),
+                ('news', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buckets', to='news.news')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='news',
+            name='story',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='articles', to='news.story'),
+        ),
+    ]
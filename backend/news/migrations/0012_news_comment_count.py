@@ -0,0 +1,33 @@
+# Generated by Django 4.1.2 on 2026-10-18 18:25
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_comments(apps, schema_editor):
+    News = apps.get_model('news', 'News')
+    Comment = apps.get_model('news', 'Comment')
+    counts = (Comment.objects.filter(news=OuterRef('pk')).order_by()
+              .values('news').annotate(count=Count('id')).values('count'))
+    News.objects.update(comment_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0011_stories'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='news',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_comments, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['news', 'created_at'], name='news_commen_news_id_30bb08_idx'),
+        ),
+    ]
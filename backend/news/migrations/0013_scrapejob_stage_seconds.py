@@ -0,0 +1,18 @@
+# Generated by Django 4.1.2 on 2026-10-18 18:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0012_news_comment_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scrapejob',
+            name='stage_seconds',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
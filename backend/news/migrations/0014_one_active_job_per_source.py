@@ -0,0 +1,32 @@
+# Generated by Django 4.1.2 on 2026-10-18 18:38
+
+from django.db import migrations, models
+
+
+def fail_duplicate_active_jobs(apps, schema_editor):
+    # a running job of a source, else its newest queued one, stays active
+    ScrapeJob = apps.get_model('news', 'ScrapeJob')
+    active = ScrapeJob.objects.filter(status__in=['queued', 'running']).order_by(
+        '-status', '-created_at')
+    kept = set()
+    for job in active:
+        if job.source in kept:
+            job.status = 'failed'
+            job.error = 'Superseded by a newer job of the same source.'
+            job.save(update_fields=['status', 'error'])
+        kept.add(job.source)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0013_scrapejob_stage_seconds'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_active_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='scrapejob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'running'])), fields=('source',), name='one_active_job_per_source'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.1.2 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news', '0014_one_active_job_per_source'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeWorker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True)),
+                ('heartbeat_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SourceLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=50, unique=True)),
+                ('owner', models.CharField(max_length=200)),
+                ('acquired_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='scrapejob',
+            name='worker',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+    ]
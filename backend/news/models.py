@@ -1,26 +1,92 @@
 from django.db import models
+from django.utils import timezone
 from account.models import UserProfile
 
 # Create your models here.
 
 
+class Story(models.Model):
+    '''
+    Articles of different sources covering the same story, grouped by
+    news.similarity. A story exists once two articles match.
+    '''
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f'Story {self.id}'
+
+
 class News(models.Model):
     id = models.AutoField(primary_key=True)
     title = models.CharField(max_length=300)
 
     image = models.ImageField(
         upload_to='posts_images/', default='posts_images/default-image.png', max_length=500)
+    # storage names of the resized copies, {size: {format: name}}
+    image_variants = models.JSONField(default=dict, blank=True)
     author = models.CharField(max_length=150)
     summary = models.TextField(max_length=300)
     content = models.TextField()
     created = models.CharField(max_length=150)
+    # `created` as printed by the source, parsed by news.dates
+    published_at = models.DateTimeField(blank=True, null=True, db_index=True)
     created_ad = models.DateField(auto_now_add=True, blank=True, null=True)
+    ingested_at = models.DateTimeField(auto_now_add=True, db_index=True)
     source = models.CharField(max_length=200)
+    # key of the source in news.sources.SOURCES, the display name is `source`
+    source_key = models.SlugField(max_length=50, blank=True, db_index=False)
+    url = models.URLField(max_length=500, unique=True,
+                          blank=True, null=True)
+    # weighted token count of the indexed text, for search ranking
+    search_length = models.PositiveIntegerField(default=0)
+    # MinHash signature of the title and content, see news.similarity
+    signature = models.JSONField(default=list, blank=True)
+    story = models.ForeignKey(Story, on_delete=models.SET_NULL, blank=True,
+                              null=True, related_name="articles")
+    # kept current by the comment views, so feeds need not count comments
+    comment_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # per-source feeds are a range scan of the newest rows of one source
+        indexes = [models.Index(fields=['source_key', 'ingested_at']),
+                   models.Index(fields=['source_key', 'published_at'])]
 
     def __str__(self):
         return f"{str(self.id)} News ID"
 
 
+class SearchPosting(models.Model):
+    '''
+    One entry of the full-text index: `term` occurs in `news` with the
+    weighted `frequency`. Maintained by news.search.
+    '''
+    term = models.CharField(max_length=64)
+    news = models.ForeignKey(
+        News, on_delete=models.CASCADE, related_name="postings")
+    frequency = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(
+            fields=['term', 'news'], name='unique_posting')]
+
+    def __str__(self):
+        return f'{self.term}: {self.news_id}'
+
+
+class SimilarityBucket(models.Model):
+    '''
+    One LSH band of the signature of `news`: articles sharing a `key` are
+    candidate near-duplicates. Maintained by news.similarity.
+    '''
+    key = models.BigIntegerField(db_index=True)
+    news = models.ForeignKey(
+        News, on_delete=models.CASCADE, related_name="buckets")
+
+    def __str__(self):
+        return f'{self.key}: {self.news_id}'
+
+
 class Comment(models.Model):
     user = models.ForeignKey(
         UserProfile, on_delete=models.CASCADE, related_name="comments")
@@ -32,6 +98,88 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        # an article's thread, newest first, is a range scan of this index
+        indexes = [models.Index(fields=['news', 'created_at'])]
 
     def __str__(self):
         return f'{self.news}: {self.comment}:{self.id}'
+
+
+class ScrapeJob(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    source = models.CharField(max_length=50)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    stage = models.CharField(max_length=200, blank=True)
+    items_inserted = models.PositiveIntegerField(default=0)
+    items_updated = models.PositiveIntegerField(default=0)
+    items_skipped = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    # name of the ScrapeWorker that claimed the job
+    worker = models.CharField(max_length=200, blank=True)
+    # circuit breaker, retry and cache counters of the worker's fetcher
+    fetch_stats = models.JSONField(default=dict, blank=True)
+    # seconds spent in every stage of the scrape, see engine.iter_articles
+    stage_seconds = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    ACTIVE = (QUEUED, RUNNING)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['source', 'status'])]
+        constraints = [
+            # requests for a scrape that is already on its way attach to it
+            models.UniqueConstraint(fields=['source'],
+                                    condition=models.Q(status__in=['queued', 'running']),
+                                    name='one_active_job_per_source'),
+        ]
+
+    @property
+    def duration(self):
+        if self.started_at is None:
+            return None
+        end = self.finished_at or timezone.now()
+        return (end - self.started_at).total_seconds()
+
+    def __str__(self):
+        return f'{self.source} scrape {self.id}: {self.status}'
+
+
+class ScrapeWorker(models.Model):
+    '''
+    A scrape worker process, alive while its heartbeat is younger than
+    SCRAPE_LEASE_TTL. The live workers share the sources between them.
+    '''
+    name = models.CharField(max_length=200, unique=True)
+    heartbeat_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.name
+
+
+class SourceLease(models.Model):
+    '''
+    The right of one worker to schedule and run the scrapes of a source until
+    `expires_at`. Its owner renews it with every heartbeat; once it expires
+    any worker may take it over.
+    '''
+    source = models.CharField(max_length=50, unique=True)
+    owner = models.CharField(max_length=200)
+    acquired_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.source} leased to {self.owner} until {self.expires_at}'
@@ -0,0 +1,34 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class NewsCursorPagination(CursorPagination):
+    '''
+    Keyset pagination over the indexed ingest timestamp. Each page is an index
+    range scan from the cursor, whatever the page's depth or table size.
+    '''
+    ordering = '-ingested_at'
+    page_size = getattr(settings, 'NEWS_PAGE_SIZE', 20)
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class NewsSearchPagination(PageNumberPagination):
+    '''
+    Search results are ordered by score, which has no index to seek on, so
+    they are paged by number.
+    '''
+    page_size = getattr(settings, 'NEWS_PAGE_SIZE', 20)
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class StoryCursorPagination(NewsCursorPagination):
+    ordering = '-updated_at'
+
+
+class CommentCursorPagination(NewsCursorPagination):
+    '''
+    Keyset pagination of comment threads over the (news, created_at) index.
+    '''
+    ordering = '-created_at'
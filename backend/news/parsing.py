@@ -0,0 +1,66 @@
+import importlib.util
+
+from bs4 import BeautifulSoup, SoupStrainer
+from django.conf import settings
+
+# fastest first; html.parser ships with Python and is always there
+BACKENDS = ['lxml', 'html.parser']
+
+
+def available_backends():
+    return [backend for backend in BACKENDS
+            if backend == 'html.parser' or importlib.util.find_spec(backend)]
+
+
+def default_backend():
+    '''
+    The SCRAPER_HTML_PARSER setting, or else the fastest installed backend.
+    '''
+    return getattr(settings, 'SCRAPER_HTML_PARSER', None) or available_backends()[0]
+
+
+class _AnyStrainer(SoupStrainer):
+    '''
+    Keeps what any of `strainers` keeps. Beautiful Soup asks search_tag()
+    before 4.13 and allow_tag_creation() since.
+    '''
+
+    def __init__(self, strainers):
+        super().__init__()
+        self.strainers = strainers
+
+    def search_tag(self, *args):
+        return any(strainer.search_tag(*args) for strainer in self.strainers)
+
+    def allow_tag_creation(self, *args):
+        return any(strainer.allow_tag_creation(*args) for strainer in self.strainers)
+
+    def allow_string_creation(self, string):
+        return False
+
+
+def strainer(scope):
+    '''
+    A SoupStrainer that keeps only the elements matching `scope`, a simple
+    `tag.class.class` selector or a tuple of them, together with everything
+    inside them.
+    '''
+    if isinstance(scope, tuple):
+        return _AnyStrainer([strainer(each) for each in scope])
+
+    tag, *classes = scope.split('.')
+    if not classes:
+        return SoupStrainer(tag)
+
+    # while parsing, the class attribute is still the raw string
+    wanted = set(classes)
+    return SoupStrainer(tag, class_=lambda value: bool(value) and wanted <= set(value.split()))
+
+
+def make_soup(html, scope=None, backend=None):
+    '''
+    Parses `html` with `backend`, building only the subtree under `scope`
+    when one is given.
+    '''
+    parse_only = strainer(scope) if scope else None
+    return BeautifulSoup(html, backend or default_backend(), parse_only=parse_only)
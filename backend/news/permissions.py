@@ -1,9 +1,11 @@
 from rest_framework import permissions
-from .models import News, Comment
 
 
-class IsTheCommentAuthor(permissions.DjangoModelPermissions):
+class IsTheCommentAuthor(permissions.BasePermission):
+    '''
+    Only the author of a comment may change it. The check runs on the comment
+    the view has already fetched, so it costs no query.
+    '''
 
-    def has_permission(self, request, view):
-        if request.user.id == Comment.objects.get(id=view.kwargs['pk']).user.id:
-            return True
+    def has_object_permission(self, request, view, obj):
+        return obj.user_id == request.user.id
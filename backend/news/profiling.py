@@ -0,0 +1,117 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+REQUEST_SECONDS = metrics.Histogram(
+    'newsagg_http_request_seconds', 'Wall time of API requests by route.',
+    ['endpoint', 'method'])
+REQUEST_QUERIES = metrics.Histogram(
+    'newsagg_http_request_queries', 'SQL queries run by API requests by route.',
+    ['endpoint', 'method'], buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
+DUPLICATE_QUERIES = metrics.Counter(
+    'newsagg_http_duplicate_queries_total',
+    'Queries repeating one already run by the same request, by route.', ['endpoint'])
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    '''
+    The shape of a query: placeholder lists of any length and runs of
+    whitespace collapsed, so an N+1 loop shows as one fingerprint run N times.
+    '''
+    return _SPACE.sub(' ', _IN_LIST.sub('IN (...)', sql)).strip()
+
+
+class QueryLog:
+    '''
+    Execute wrapper counting the queries, their fingerprints and their time.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter()
+        self.fingerprint_seconds = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - start
+            shape = fingerprint(sql)
+            self.count += 1
+            self.seconds += seconds
+            self.fingerprints[shape] += 1
+            self.fingerprint_seconds[shape] += seconds
+
+    @property
+    def duplicates(self):
+        return sum(count - 1 for count in self.fingerprints.values())
+
+    def top(self, limit=10):
+        return [{'sql': shape, 'count': count,
+                 'ms': round(self.fingerprint_seconds[shape] * 1000, 2)}
+                for shape, count in self.fingerprints.most_common(limit)]
+
+
+class ProfilingMiddleware:
+    '''
+    Measures every request's wall time, SQL query count, time spent in the
+    database and repeated query fingerprints, when API_PROFILING is on.
+
+    The numbers go out as a Server-Timing header, into the per-route
+    histograms of news.metrics, and into a warning with the most run query
+    fingerprints for requests slower than API_SLOW_REQUEST_MS. The queries of
+    a streaming response body run after the middleware returns and are not
+    counted.
+    '''
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'API_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, 'API_SLOW_REQUEST_MS', 500)
+
+    def __call__(self, request):
+        log = QueryLog()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(log))
+            response = self.get_response(request)
+        seconds = time.perf_counter() - start
+
+        match = request.resolver_match
+        endpoint = '/' + match.route if match is not None else 'unmatched'
+        REQUEST_SECONDS.observe(seconds, endpoint=endpoint, method=request.method)
+        REQUEST_QUERIES.observe(log.count, endpoint=endpoint, method=request.method)
+        if log.duplicates:
+            DUPLICATE_QUERIES.inc(log.duplicates, endpoint=endpoint)
+
+        response['Server-Timing'] = (
+            f'total;dur={seconds * 1000:.1f}, '
+            f'db;dur={log.seconds * 1000:.1f};desc="{log.count} queries", '
+            f'dup;desc="{log.duplicates} duplicate queries"')
+
+        if seconds * 1000 >= self.slow_ms:
+            logger.warning('Slow request %s %s', request.method, request.path, extra={
+                'event': 'slow_request', 'method': request.method, 'path': request.path,
+                'endpoint': endpoint, 'status': response.status_code,
+                'ms': round(seconds * 1000, 1), 'queries': log.count,
+                'db_ms': round(log.seconds * 1000, 1), 'duplicates': log.duplicates,
+                'fingerprints': log.top()})
+        return response
+
@@ -0,0 +1,188 @@
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+from django.conf import settings
+from django.db.models import Case, Count, FloatField, Sum, Value, When
+from django.db.models.functions import Cast
+from django.utils.html import escape
+
+from .models import News, SearchPosting
+
+# words are runs of letters, digits and Devanagari signs; the dandas end them
+TOKEN = re.compile(r'[\w\u0900-\u0963\u0966-\u097f\u200c\u200d]+')
+
+# how much one occurrence of a term counts in each field
+FIELD_WEIGHTS = (('title', 3), ('summary', 2), ('content', 1))
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+MAX_TERM_LENGTH = SearchPosting._meta.get_field('term').max_length
+
+# spelling variants Nepali writers use interchangeably are folded together:
+# Devanagari digits, candrabindu and anusvara, long and short i and u
+_FOLD = str.maketrans({
+    **{chr(0x0966 + digit): str(digit) for digit in range(10)},
+    '\u0901': '\u0902',
+    '\u0940': '\u093f', '\u0942': '\u0941',
+    '\u0908': '\u0907', '\u090a': '\u0909',
+    '\u200c': None, '\u200d': None,
+})
+
+
+def fold(word):
+    return unicodedata.normalize('NFC', word).casefold().translate(_FOLD)
+
+
+STOP_WORDS = {fold(word) for word in (
+    'र', 'तथा', 'पनि', 'छ', 'छन्', 'हो', 'हुन्', 'यो', 'त्यो', 'यस', 'ती',
+    'भने', 'लागि', 'नै', 'त', 'कि', 'वा', 'एक', 'the', 'a', 'an', 'and',
+    'or', 'of', 'to', 'in', 'on', 'for', 'is', 'are', 'was', 'by', 'with',
+)}
+
+# postpositions and the plural marker written joined to Nepali nouns, longest first
+SUFFIXES = sorted({fold(suffix) for suffix in (
+    'हरूबाट', 'हरूलाई', 'हरूको', 'हरूका', 'हरूकी', 'हरूले', 'हरूमा', 'हरू',
+    'लाई', 'बाट', 'देखि', 'सम्म', 'भित्र', 'को', 'का', 'की', 'ले', 'मा',
+)}, key=len, reverse=True)
+
+
+def normalize(word):
+    '''
+    The index term of `word`, or None for stop words.
+    '''
+    word = fold(word)
+    if not word or word in STOP_WORDS:
+        return None
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 2:
+            word = word[:-len(suffix)]
+            break
+    return word[:MAX_TERM_LENGTH]
+
+
+def tokenize(text):
+    return [term for term in map(normalize, TOKEN.findall(text or '')) if term]
+
+
+def document_terms(news):
+    '''
+    Weighted frequencies of the terms of `news`, keyed by term.
+    '''
+    counts = Counter()
+    for field, weight in FIELD_WEIGHTS:
+        for term in tokenize(getattr(news, field)):
+            counts[term] += weight
+    return counts
+
+
+def index_news(rows):
+    '''
+    Replaces the postings of the News `rows`, which need their id, title,
+    summary and content, and stores their search_length. Run it inside the
+    transaction that wrote the rows so the index never lags behind them.
+    '''
+    rows = list(rows)
+    if not rows:
+        return
+
+    postings = []
+    for news in rows:
+        counts = document_terms(news)
+        news.search_length = sum(counts.values())
+        postings.extend(SearchPosting(term=term, news_id=news.id, frequency=frequency)
+                        for term, frequency in counts.items())
+
+    SearchPosting.objects.filter(news_id__in=[news.id for news in rows]).delete()
+    SearchPosting.objects.bulk_create(postings, batch_size=1000)
+    News.objects.bulk_update(rows, ['search_length'], batch_size=500)
+    _stats.clear()
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def corpus_stats():
+    '''
+    Number of indexed articles and their average search_length. Both move
+    slowly, so they are kept for SEARCH_STATS_TTL seconds.
+    '''
+    with _stats_lock:
+        if _stats.get('expires', 0) < time.monotonic():
+            stats = News.objects.filter(search_length__gt=0).aggregate(
+                count=Count('id'), total=Sum('search_length'))
+            _stats.update(
+                count=stats['count'],
+                average=(stats['total'] or 0) / max(stats['count'], 1),
+                expires=time.monotonic() + getattr(settings, 'SEARCH_STATS_TTL', 300))
+        return _stats['count'], _stats['average']
+
+
+def rank(query):
+    '''
+    Ranks the articles containing every term of `query` by BM25, best first.
+
+    Returns a queryset of {'news': id, 'score': float} dicts computed from the
+    postings of the query terms alone, so its cost follows the number of
+    matching articles rather than the size of the table.
+    '''
+    terms = set(tokenize(query))
+    frequencies = dict(SearchPosting.objects.filter(term__in=terms)
+                       .values_list('term').annotate(Count('id')))
+    if not terms or len(frequencies) < len(terms):
+        return SearchPosting.objects.none().values('news')
+
+    count, average = corpus_stats()
+    idf = Case(*[When(term=term, then=Value(math.log(1 + (count - df + 0.5) / (df + 0.5))))
+                 for term, df in frequencies.items()], output_field=FloatField())
+    tf = Cast('frequency', FloatField())
+    length = Cast('news__search_length', FloatField())
+    score = idf * tf * Value(K1 + 1) / (
+        tf + Value(K1 * (1 - B)) + Value(K1 * B / max(average, 1)) * length)
+
+    return (SearchPosting.objects.filter(term__in=terms)
+            .values('news')
+            .annotate(matched=Count('id'), score=Sum(score, output_field=FloatField()))
+            .filter(matched=len(terms))
+            .order_by('-score', '-news'))
+
+
+def highlight(text, terms, width=None):
+    '''
+    HTML-escaped `text` with the words matching `terms` wrapped in <mark>.
+
+    With `width`, only the `width` words around the densest run of matches
+    are kept, with an ellipsis where the text was cut.
+    '''
+    words = list(TOKEN.finditer(text or ''))
+    hits = [i for i, word in enumerate(words) if normalize(word.group()) in terms]
+
+    start, end = 0, len(words)
+    if width is not None and len(words) > width:
+        # the window starting a little before the hit with most hits after it
+        best = max(hits, key=lambda i: sum(i <= j < i + width for j in hits), default=0)
+        start = max(0, min(best - width // 4, len(words) - width))
+        end = start + width
+
+    hit_set = set(hits)
+    parts = ['…' if start > 0 else '']
+    position = words[start].start() if start > 0 else 0
+    for i in range(start, end):
+        word = words[i]
+        parts.append(escape(text[position:word.start()]))
+        if i in hit_set:
+            parts.append(f'<mark>{escape(word.group())}</mark>')
+        else:
+            parts.append(escape(word.group()))
+        position = word.end()
+    if end < len(words):
+        parts.append('…')
+    else:
+        parts.append(escape(text[position:]))
+    return ''.join(parts)
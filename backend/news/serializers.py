@@ -1,5 +1,7 @@
+from django.core.files.storage import default_storage
 from rest_framework import serializers
-from .models import News, Comment
+from .models import News, Comment, ScrapeJob, Story
+from .search import highlight
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -16,9 +18,110 @@ class CommentSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class NewsSerializer(serializers.ModelSerializer):
+def media_url(name, request=None):
+    url = default_storage.url(name)
+    return request.build_absolute_uri(url) if request else url
+
+
+class SparseFieldsMixin:
+    '''
+    Lets clients ask for a subset of the fields with `?fields=title,source`.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        wanted = request.query_params.get('fields') if request else None
+        if wanted:
+            wanted = set(wanted.split(','))
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
+class NewsSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    '''
+    An article with its comments, without the fields kept for search and
+    story clustering.
+    '''
     comments = CommentSerializer(many=True, read_only=True)
+    image_variants = serializers.SerializerMethodField()
+
+    def get_image_variants(self, obj):
+        request = self.context.get('request')
+        return {size: {fmt: media_url(name, request) for fmt, name in formats.items()}
+                for size, formats in obj.image_variants.items()}
 
     class Meta:
         model = News
-        fields = '__all__'
+        exclude = ['signature', 'search_length']
+
+
+class NewsListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    '''
+    Compact feed card representation. The view loads only LIST_FIELDS.
+    '''
+    LIST_FIELDS = ['id', 'title', 'summary', 'source', 'created',
+                   'published_at', 'image', 'image_variants', 'ingested_at',
+                   'story', 'comment_count']
+
+    thumbnail = serializers.SerializerMethodField()
+
+    def get_thumbnail(self, obj):
+        name = obj.image_variants.get('thumb', {}).get('webp') or obj.image.name
+        return media_url(name, self.context.get('request'))
+
+    class Meta:
+        model = News
+        fields = ['id', 'title', 'summary', 'source', 'thumbnail',
+                  'created', 'published_at', 'ingested_at', 'story',
+                  'comment_count']
+
+
+class NewsSearchSerializer(NewsListSerializer):
+    '''
+    A feed card with its BM25 `score`, the title with the matched words in
+    <mark> tags and a snippet of the text around the matches. The view sets
+    `score` on each row and passes the query `terms` in the context.
+    '''
+    LIST_FIELDS = NewsListSerializer.LIST_FIELDS + ['content']
+    SNIPPET_WORDS = 30
+
+    score = serializers.FloatField(read_only=True)
+    highlight = serializers.SerializerMethodField()
+    snippet = serializers.SerializerMethodField()
+
+    def get_highlight(self, obj):
+        return highlight(obj.title, self.context['terms'])
+
+    def get_snippet(self, obj):
+        terms = self.context['terms']
+        snippet = highlight(obj.content, terms, self.SNIPPET_WORDS)
+        if '<mark>' not in snippet:
+            # the match is in the title or summary only
+            snippet = highlight(obj.summary, terms, self.SNIPPET_WORDS)
+        return snippet
+
+    class Meta(NewsListSerializer.Meta):
+        fields = NewsListSerializer.Meta.fields + ['score', 'highlight', 'snippet']
+
+
+class StorySerializer(serializers.ModelSerializer):
+    '''
+    A story with the feed cards of its articles, oldest first. The view
+    prefetches the articles the way NewsListApi loads them.
+    '''
+    articles = NewsListSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Story
+        fields = ['id', 'created_at', 'updated_at', 'articles']
+
+
+class ScrapeJobSerializer(serializers.ModelSerializer):
+    duration = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ScrapeJob
+        fields = ['id', 'source', 'status', 'stage', 'items_inserted',
+                  'items_updated', 'items_skipped', 'error', 'fetch_stats',
+                  'stage_seconds', 'created_at', 'started_at', 'finished_at', 'duration']
@@ -0,0 +1,127 @@
+import hashlib
+import random
+import struct
+import zlib
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import News, SimilarityBucket, Story
+from .search import tokenize
+
+# 20 bands of 3 rows put the LSH threshold, where two articles have even odds
+# of sharing a band, at a Jaccard similarity of (1 / 20) ** (1 / 3) ~ 0.37
+BANDS = 20
+ROWS = 3
+PERMUTATIONS = BANDS * ROWS
+
+# articles with fewer distinct terms carry too little text to compare
+MIN_SHINGLES = 8
+
+_PRIME = (1 << 61) - 1
+# the seed is fixed: stored signatures are only comparable to new ones made
+# with the same permutations
+_random = random.Random(20221020)
+_PERMUTATIONS = [(_random.randrange(1, _PRIME), _random.randrange(_PRIME))
+                 for _ in range(PERMUTATIONS)]
+
+
+def shingles(news):
+    '''
+    The distinct index terms of the title and content of `news`, hashed.
+    '''
+    terms = tokenize(news.title) + tokenize(news.content)
+    return {zlib.crc32(term.encode()) for term in terms}
+
+
+def signature(hashes):
+    '''
+    MinHash signature of a set of hashed shingles, or an empty list when the
+    set is too small to compare.
+    '''
+    if len(hashes) < MIN_SHINGLES:
+        return []
+    return [min((a * x + b) % _PRIME for x in hashes) & 0xffffffff
+            for a, b in _PERMUTATIONS]
+
+
+def similarity(first, second):
+    '''
+    Estimated Jaccard similarity of the articles with these signatures.
+    '''
+    if not first or len(first) != len(second):
+        return 0.0
+    return sum(a == b for a, b in zip(first, second)) / len(first)
+
+
+def band_keys(signature):
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(struct.pack(f'>H{ROWS}I', band, *rows),
+                                 digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'big', signed=True))
+    return keys
+
+
+def _best_match(news, keys, pending, threshold):
+    # candidates are the stored articles and those earlier in the batch that
+    # share at least one band with `news`
+    candidates = {candidate.id: candidate for candidate in News.objects.filter(
+        buckets__key__in=keys).only('id', 'signature', 'story')}
+    for key in keys:
+        for candidate in pending.get(key, ()):
+            candidates[candidate.id] = candidate
+
+    best, best_score = None, threshold
+    for candidate in candidates.values():
+        score = similarity(news.signature, candidate.signature)
+        if score >= best_score:
+            best, best_score = candidate, score
+    return best
+
+
+def cluster_news(rows):
+    '''
+    Signs the News `rows`, which need their id, title and content, replaces
+    their LSH buckets and puts each one that is not in a story yet into the
+    story of its most similar article, if any is at least STORY_SIMILARITY
+    alike. Matching looks only at the articles sharing a band, so its cost
+    does not grow with the number of stored articles.
+
+    Run it inside the transaction that wrote the rows.
+    '''
+    rows = list(rows)
+    if not rows:
+        return
+    threshold = getattr(settings, 'STORY_SIMILARITY', 0.4)
+
+    ids = [news.id for news in rows]
+    SimilarityBucket.objects.filter(news_id__in=ids).delete()
+    stories = dict(News.objects.filter(id__in=ids).values_list('id', 'story'))
+
+    pending = {}
+    buckets = []
+    touched = set()
+    for news in rows:
+        news.signature = signature(shingles(news))
+        news.story_id = stories.get(news.id)
+        keys = band_keys(news.signature) if news.signature else []
+
+        if keys and news.story_id is None:
+            match = _best_match(news, keys, pending, threshold)
+            if match is not None:
+                if match.story_id is None:
+                    match.story_id = Story.objects.create().id
+                    if match.id not in stories:
+                        News.objects.filter(id=match.id).update(story=match.story_id)
+                news.story_id = match.story_id
+                touched.add(news.story_id)
+
+        for key in keys:
+            pending.setdefault(key, []).append(news)
+            buckets.append(SimilarityBucket(key=key, news_id=news.id))
+
+    SimilarityBucket.objects.bulk_create(buckets, batch_size=1000)
+    News.objects.bulk_update(rows, ['signature', 'story'], batch_size=500)
+    Story.objects.filter(id__in=touched).update(updated_at=timezone.now())
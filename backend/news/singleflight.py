@@ -0,0 +1,63 @@
+import threading
+import time
+
+from django.conf import settings
+
+_local_locks = {}
+_local_guard = threading.Lock()
+
+
+def _local_lock(key):
+    with _local_guard:
+        return _local_locks.setdefault(key, threading.Lock())
+
+
+def single_flight(cache, key, compute, ttl, wait=None, poll=0.02):
+    '''
+    Returns `cache[key]`, calling `compute` to fill it when it is missing. Of
+    the callers that miss the same key at the same time, across threads and
+    processes sharing `cache`, only one computes; the others wait up to `wait`
+    seconds (SINGLE_FLIGHT_WAIT, 10 by default) for its value before computing
+    it themselves.
+
+    The lock is `cache.add` of a marker next to the key, which expires after
+    SINGLE_FLIGHT_LOCK_TIMEOUT seconds should its holder die. Threads of one
+    process first queue on a local lock, so they do not poll the cache.
+
+    `compute` may return None for a value that must not be cached, such as
+    an error response; the waiting callers then compute their own.
+    '''
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    wait = getattr(settings, 'SINGLE_FLIGHT_WAIT', 10) if wait is None else wait
+    lock_timeout = getattr(settings, 'SINGLE_FLIGHT_LOCK_TIMEOUT', 30)
+    lock_key = f'{key}:lock'
+    deadline = time.monotonic() + wait
+
+    local = _local_lock(key)
+    if not local.acquire(timeout=wait):
+        return compute()
+    try:
+        while True:
+            value = cache.get(key)
+            if value is not None:
+                return value
+            if cache.add(lock_key, True, lock_timeout):
+                try:
+                    value = compute()
+                    if value is not None:
+                        cache.set(key, value, ttl)
+                    return value
+                finally:
+                    cache.delete(lock_key)
+            if time.monotonic() >= deadline:
+                return compute()
+            time.sleep(poll)
+    finally:
+        local.release()
+        with _local_guard:
+            # the last one out drops the lock, so keys do not pile up
+            if _local_locks.get(key) is local and not local.locked():
+                del _local_locks[key]
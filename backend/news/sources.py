@@ -0,0 +1,113 @@
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple, Union
+
+
+@dataclass(frozen=True)
+class Field:
+    '''
+    Where one value of an article is found: a CSS `selector` relative to the
+    listing item or detail page, read from `attr` or from the element text.
+    With `many`, the text of every match is joined into one value.
+    '''
+    selector: str
+    attr: Optional[str] = None
+    many: bool = False
+
+
+@dataclass(frozen=True)
+class SourceSpec:
+    '''
+    Declarative description of a news site.
+
+    `items` selects one element per article on the homepage and
+    `listing_fields` are read from each of them; `url` and `title` are
+    required. `detail_fields` are read from the article page, below `root`
+    when given, and fill in or override the listing values; a page missing
+    any of the `required` detail fields is not the article.
+
+    `listing_scope` and `detail_scope` are simple `tag.class` selectors, or
+    tuples of them, of the parts of each page the fields live in. Only those
+    subtrees are parsed.
+    '''
+    key: str
+    name: str
+    homepage: str
+    items: str
+    listing_fields: Dict[str, Field]
+    detail_fields: Dict[str, Field] = field(default_factory=dict)
+    required: Tuple[str, ...] = ('content',)
+    root: Optional[str] = None
+    listing_scope: Optional[Union[str, Tuple[str, ...]]] = None
+    detail_scope: Optional[Union[str, Tuple[str, ...]]] = None
+
+
+SOURCES = {}
+
+
+def register(spec):
+    SOURCES[spec.key] = spec
+    return spec
+
+
+register(SourceSpec(
+    key='ekantipur',
+    name='Ekantipur',
+    homepage='https://ekantipur.com/',
+    items='section.main-news.layout3 article',
+    listing_scope='section.main-news.layout3',
+    listing_fields={
+        'title': Field('h1 a'),
+        'url': Field('h1 a', attr='href'),
+        # only the top story paragraph, not the ones of nested sections
+        'summary': Field(':scope > p'),
+    },
+    root='div.col-xs-10.col-sm-10.col-md-10',
+    detail_scope='div.col-xs-10.col-sm-10.col-md-10',
+    detail_fields={
+        'author': Field('span.author'),
+        'published': Field('time'),
+        'content': Field('p', many=True),
+        'image_url': Field('figure img', attr='data-src'),
+    },
+))
+
+register(SourceSpec(
+    key='onlinekhabar',
+    name='Onlinekhabar',
+    homepage='https://www.onlinekhabar.com/',
+    items='section.ok-bises div.ok-container',
+    listing_scope='section.ok-bises',
+    listing_fields={
+        'title': Field('h2'),
+        'url': Field('h2 a', attr='href'),
+    },
+    detail_scope='div.ok-single-post',
+    detail_fields={
+        'author': Field('span.author-name'),
+        'summary': Field('div.ok18-single-post-content-wrap p'),
+        'published': Field('div.ok-news-post-hour span'),
+        'content': Field('div.ok18-single-post-content-wrap p', many=True),
+        'image_url': Field('div.post-thumbnail img', attr='src'),
+    },
+))
+
+register(SourceSpec(
+    key='nagarik',
+    name='Nagarik News',
+    homepage='https://nagariknews.nagariknetwork.com/',
+    items='div.justin article.list-group-item',
+    listing_scope='div.justin',
+    listing_fields={
+        'title': Field('h1'),
+        'url': Field('h1 a', attr='href'),
+        'summary': Field('p'),
+    },
+    # the text is outside the section with the byline and picture
+    detail_scope=('div.main-news-section', 'article'),
+    detail_fields={
+        'author': Field('author a'),
+        'published': Field('time'),
+        'content': Field('article p', many=True),
+        'image_url': Field('div.main-news-section img', attr='src'),
+    },
+))
@@ -1,3 +1,1470 @@
-from django.test import TestCase
+import asyncio
+import dataclasses
+import datetime
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from PIL import Image
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, modify_settings, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.test import APIClient
+from rest_framework.throttling import BaseThrottle
+
+from asgiref.sync import async_to_sync, sync_to_async
+
+from account.models import UserProfile
+
+from . import apicache, engine, jobs, metrics, profiling
+from .apicache import api_cache
+from .dates import bs_to_ad, parse_published
+from .events import EVENTS_PATH, PollingBroadcaster, event_stream, get_broadcaster, latest_id
+from .engine import parse_detail, parse_listing
+from .fetch import CircuitBreaker, CircuitOpen, FetchError, Fetcher, RetryPolicy
+from .httpcache import ResponseCache
+from .images import FORMATS, VARIANTS, ensure_variants, hashed_name, store_image, variant_name
+from .ingest import persist_articles
+from .leases import Coordinator
+from .models import Comment, News, ScrapeJob, SourceLease, Story
+from .parsing import available_backends
+from .search import tokenize
+from .views import NewsDetailApi
+from .singleflight import single_flight
+from .sources import SOURCES
+
+TESTDATA = os.path.join(os.path.dirname(__file__), 'testdata')
+
+
+def fixture_page(name):
+    with open(os.path.join(TESTDATA, name), encoding='utf-8') as fp:
+        return fp.read()
+
+
+class SlowPageHandler(BaseHTTPRequestHandler):
+    latency = 0.2
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        body = f"<html><body>{self.path}</body></html>".encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ETagPageHandler(BaseHTTPRequestHandler):
+    etag = '"v1"'
+    served = 0
+
+    def do_GET(self):
+        type(self).served += 1
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = f"<html><body>{self.path}</body></html>".encode()
+        self.send_response(200)
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FlakyPageHandler(BaseHTTPRequestHandler):
+    '''
+    Answers 503 to the first `failures` requests, 404 to /missing, and
+    /loop with a redirect to itself.
+    '''
+    failures = 0
+    served = 0
+
+    def do_GET(self):
+        type(self).served += 1
+        if self.path == '/loop':
+            self.send_response(302)
+            self.send_header('Location', '/loop')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path == '/missing':
+            status = 404
+        elif type(self).served <= self.failures:
+            status = 503
+        else:
+            status = 200
+        self.send_response(status)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def png(size=(600, 400), color='navy'):
+    out = io.BytesIO()
+    Image.new('RGB', size, color).save(out, 'PNG')
+    return out.getvalue()
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    '''
+    Serves one PNG under any path: with a Content-Length, in chunks under
+    /chunked/, with a lying Content-Length under /huge/ and a malformed one
+    under /malformed/.
+    '''
+    protocol_version = 'HTTP/1.1'
+    image = png()
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        if self.path.startswith('/chunked/'):
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for start in range(0, len(self.image), 1000):
+                chunk = self.image[start:start + 1000]
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            self.wfile.write(b'0\r\n\r\n')
+            return
+        length = {'/huge/': str(10 ** 9), '/malformed/': '12 bytes'}.get(
+            self.path[:self.path.find('/', 1) + 1], str(len(self.image)))
+        self.send_header('Content-Length', length)
+        self.end_headers()
+        if length == str(len(self.image)):
+            self.wfile.write(self.image)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class NewsSiteHandler(BaseHTTPRequestHandler):
+    '''
+    The Nagarik fixture pages, with the article at /news/98700-0 gone.
+    '''
+
+    def do_GET(self):
+        if self.path == '/':
+            status, body = 200, fixture_page('nagarik_home.html')
+        elif self.path == '/news/98700-0':
+            status, body = 404, '<html><body><h1>Page not found</h1></body></html>'
+        else:
+            status, body = 200, fixture_page('nagarik_article.html')
+        body = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalServer(ThreadingHTTPServer):
+    # the default backlog of 5 makes bursts of connections wait on SYN retries
+    request_queue_size = 64
+
+
+class LocalSiteMixin:
+    '''
+    Runs a local HTTP stand-in for a news site on a random port.
+    '''
+    handler = SlowPageHandler
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = LocalServer(('127.0.0.1', 0), cls.handler)
+        cls.thread = threading.Thread(
+            target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+
+class FetcherTests(LocalSiteMixin, SimpleTestCase):
+
+    def test_fetch_all_keeps_order(self):
+        fetcher = Fetcher(max_workers=4, per_host=4)
+        urls = [f"{self.base_url}/news/{i}" for i in range(6)]
+        pages = fetcher.fetch_all(urls)
+        self.assertEqual(
+            pages, [f"<html><body>/news/{i}</body></html>" for i in range(6)])
+
+    def test_concurrent_fetch_is_faster_than_sequential(self):
+        urls = [f"{self.base_url}/news/{i}" for i in range(10)]
+
+        sequential = Fetcher(max_workers=1, per_host=1)
+        start = time.perf_counter()
+        sequential.fetch_all(urls)
+        sequential_time = time.perf_counter() - start
+
+        concurrent = Fetcher(max_workers=10, per_host=10)
+        start = time.perf_counter()
+        concurrent.fetch_all(urls)
+        concurrent_time = time.perf_counter() - start
+
+        # ten pages at 200ms each: ~2s one by one, ~one page time concurrently
+        self.assertGreater(sequential_time, 10 * SlowPageHandler.latency)
+        self.assertLess(concurrent_time, 3 * SlowPageHandler.latency)
+
+    def test_per_host_cap_limits_concurrency(self):
+        urls = [f"{self.base_url}/news/{i}" for i in range(4)]
+        fetcher = Fetcher(max_workers=4, per_host=2)
+        start = time.perf_counter()
+        fetcher.fetch_all(urls)
+        elapsed = time.perf_counter() - start
+        self.assertGreaterEqual(elapsed, 2 * SlowPageHandler.latency)
+
+
+class ResponseCacheTests(LocalSiteMixin, SimpleTestCase):
+    handler = ETagPageHandler
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        ETagPageHandler.served = 0
+
+    def test_fresh_entries_skip_the_network(self):
+        fetcher = Fetcher(cache=ResponseCache(self.directory))
+        url = f"{self.base_url}/news/1"
+        first = fetcher.get_text(url, ttl=60)
+        second = fetcher.get_text(url, ttl=60)
+        self.assertEqual(first, second)
+        self.assertEqual(ETagPageHandler.served, 1)
+        self.assertEqual(fetcher.cache.stats()['hits'], 1)
+        self.assertEqual(fetcher.cache.stats()['misses'], 1)
+
+    def test_stale_entries_are_revalidated(self):
+        fetcher = Fetcher(cache=ResponseCache(self.directory))
+        url = f"{self.base_url}/news/1"
+        fetcher.get_text(url)
+        body = fetcher.get_text(url)
+        self.assertEqual(body, "<html><body>/news/1</body></html>")
+        self.assertEqual(ETagPageHandler.served, 2)
+        self.assertEqual(fetcher.cache.stats()['revalidated'], 1)
+
+    def test_cache_is_size_bounded(self):
+        page_size = len("<html><body>/news/0</body></html>")
+        fetcher = Fetcher(cache=ResponseCache(
+            self.directory, max_bytes=3 * page_size))
+        for i in range(5):
+            fetcher.get_text(f"{self.base_url}/news/{i}")
+        self.assertLessEqual(fetcher.cache.stats()['bytes'], 3 * page_size)
+        self.assertIsNone(fetcher.cache.get(f"{self.base_url}/news/0"))
+        self.assertIsNotNone(fetcher.cache.get(f"{self.base_url}/news/4"))
+
+    def test_cache_is_built_on_first_use(self):
+        directory = os.path.join(self.directory, 'lazy')
+        fetcher = Fetcher(cache=lambda: ResponseCache(directory))
+        self.assertFalse(os.path.exists(directory))
+        url = f"{self.base_url}/news/1"
+        fetcher.get_text(url, ttl=60)
+        fetcher.get_text(url, ttl=60)
+        self.assertEqual(ETagPageHandler.served, 1)
+        self.assertEqual(fetcher.cache.stats()['hits'], 1)
+
+
+class ParsingTests(SimpleTestCase):
+    listing_counts = {'ekantipur': 12, 'onlinekhabar': 8, 'nagarik': 10}
+
+    def parse(self, key, backend, scoped):
+        spec = SOURCES[key]
+        listing = parse_listing(spec, fixture_page(f'{key}_home.html'),
+                                backend, scoped)
+        article = parse_detail(spec, listing[0], fixture_page(f'{key}_article.html'),
+                               backend, scoped)
+        return listing, article
+
+    def test_fixture_pages_parse(self):
+        for key, count in self.listing_counts.items():
+            with self.subTest(source=key):
+                listing, article = self.parse(key, 'html.parser', False)
+                self.assertEqual(len(listing), count)
+                self.assertEqual(article.source, SOURCES[key].name)
+                self.assertTrue(article.author)
+                self.assertTrue(article.published)
+                self.assertTrue(article.content)
+                self.assertTrue(article.image_url.startswith('https://'))
+
+    def test_backends_and_scoped_parsing_agree(self):
+        for key in self.listing_counts:
+            expected = self.parse(key, 'html.parser', False)
+            for backend in available_backends():
+                for scoped in (True, False):
+                    with self.subTest(source=key, backend=backend, scoped=scoped):
+                        self.assertEqual(
+                            self.parse(key, backend, scoped), expected)
+
+
+class RetryPolicyTests(LocalSiteMixin, SimpleTestCase):
+    handler = FlakyPageHandler
+
+    def setUp(self):
+        FlakyPageHandler.served = 0
+
+    def fetcher(self, attempts=3, threshold=10):
+        fetcher = Fetcher(policy=RetryPolicy(attempts=attempts, backoff=0))
+        with override_settings(SCRAPER_BREAKER_THRESHOLD=threshold):
+            _, _, breaker = fetcher.session_for(self.base_url)
+        return fetcher, breaker
+
+    def test_retryable_errors_are_retried(self):
+        FlakyPageHandler.failures = 2
+        fetcher, breaker = self.fetcher()
+        self.assertEqual(fetcher.get_text(f"{self.base_url}/news"), 'ok')
+        self.assertEqual(FlakyPageHandler.served, 3)
+        self.assertEqual(breaker.stats()['retries'], 2)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_retries_are_capped(self):
+        FlakyPageHandler.failures = 10
+        fetcher, _ = self.fetcher(attempts=3)
+        with self.assertRaises(FetchError):
+            fetcher.get_text(f"{self.base_url}/news")
+        self.assertEqual(FlakyPageHandler.served, 3)
+
+    def test_client_errors_are_not_retried(self):
+        FlakyPageHandler.failures = 0
+        fetcher, _ = self.fetcher()
+        self.assertEqual(fetcher.get(f"{self.base_url}/missing").status_code, 404)
+        self.assertEqual(FlakyPageHandler.served, 1)
+
+    def test_open_circuit_fails_fast(self):
+        FlakyPageHandler.failures = 10
+        fetcher, breaker = self.fetcher(attempts=5, threshold=2)
+        with self.assertRaises(FetchError):
+            fetcher.get_text(f"{self.base_url}/news")
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(FlakyPageHandler.served, 2)
+
+        with self.assertRaises(CircuitOpen):
+            fetcher.get_text(f"{self.base_url}/news")
+        self.assertEqual(FlakyPageHandler.served, 2)
+        self.assertEqual(fetcher.fetch_all([f"{self.base_url}/news"]), [None])
+
+    def test_circuit_closes_after_successful_trial(self):
+        FlakyPageHandler.failures = 2
+        fetcher, breaker = self.fetcher(attempts=1, threshold=2)
+        for _ in range(2):
+            with self.assertRaises(FetchError):
+                fetcher.get_text(f"{self.base_url}/news")
+        breaker.opened_at -= breaker.cooldown
+        self.assertEqual(fetcher.get_text(f"{self.base_url}/news"), 'ok')
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_other_request_errors_fail_the_trial(self):
+        FlakyPageHandler.failures = 2
+        fetcher, breaker = self.fetcher(attempts=1, threshold=2)
+        for _ in range(2):
+            with self.assertRaises(FetchError):
+                fetcher.get_text(f"{self.base_url}/news")
+        breaker.opened_at -= breaker.cooldown
+
+        # too many redirects, on the half-open trial request
+        with self.assertRaises(FetchError):
+            fetcher.get_text(f"{self.base_url}/loop")
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        breaker.opened_at -= breaker.cooldown
+        self.assertEqual(fetcher.get_text(f"{self.base_url}/news"), 'ok')
+
+        fetcher, _ = self.fetcher()
+        self.assertEqual(fetcher.fetch_all([f"{self.base_url}/loop", f"{self.base_url}/news"]),
+                         [None, 'ok'])
+
+    def test_retries_failures_and_bytes_are_counted(self):
+        host = metrics.host_of(self.base_url)
+        retries = metrics.FETCH_RETRIES.value(host=host)
+        failures = metrics.FETCH_FAILURES.value(host=host)
+        downloaded = metrics.DOWNLOAD_BYTES.value(host=host, kind='page')
+
+        FlakyPageHandler.failures = 1
+        fetcher, _ = self.fetcher(attempts=2)
+        fetcher.get_text(f"{self.base_url}/news")
+        FlakyPageHandler.served, FlakyPageHandler.failures = 0, 10
+        with self.assertRaises(FetchError):
+            fetcher.get_text(f"{self.base_url}/news")
+
+        self.assertEqual(metrics.FETCH_RETRIES.value(host=host) - retries, 2)
+        self.assertEqual(metrics.FETCH_FAILURES.value(host=host) - failures, 1)
+        self.assertEqual(metrics.DOWNLOAD_BYTES.value(host=host, kind='page') - downloaded, 2)
+
+
+class TempMediaMixin:
+    '''
+    Stores media in a scratch MEDIA_ROOT.
+    '''
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.enterContext(override_settings(MEDIA_ROOT=media))
+        self.media = media
+
+
+class ImageStorageTests(TempMediaMixin, LocalSiteMixin, SimpleTestCase):
+    handler = ImageHandler
+
+    def stored(self):
+        return sorted(os.path.relpath(os.path.join(path, name), self.media)
+                      for path, _, names in os.walk(self.media) for name in names)
+
+    def test_same_content_is_stored_once(self):
+        first = store_image(f'{self.base_url}/a.png')
+        self.assertEqual(store_image(f'{self.base_url}/b.png'), first)
+        self.assertTrue(first.startswith('posts_images/') and first.endswith('.png'))
+        self.assertEqual(self.stored(), [first])
+
+    def test_concurrent_writer_leaves_no_copy(self):
+        # both writers find the name free, the second save gets renamed
+        racing = mock.Mock(wraps=default_storage, exists=mock.Mock(return_value=False))
+        with mock.patch('news.images.default_storage', racing):
+            names = {store_image(f'{self.base_url}/{i}.png') for i in range(2)}
+        self.assertEqual(len(names), 1)
+        self.assertEqual(self.stored(), list(names))
+
+    def test_chunked_body_is_streamed(self):
+        name = store_image(f'{self.base_url}/chunked/a.png')
+        with open(os.path.join(self.media, name), 'rb') as fp:
+            self.assertEqual(fp.read(), ImageHandler.image)
+
+    def test_size_cap(self):
+        with self.assertLogs('news.images', 'WARNING'):
+            self.assertIsNone(store_image(f'{self.base_url}/huge/a.png'))
+            self.assertIsNone(store_image(f'{self.base_url}/chunked/a.png',
+                                          max_bytes=len(ImageHandler.image) // 2))
+        self.assertEqual(self.stored(), [])
+
+    def test_header_and_storage_errors_skip_the_image(self):
+        with self.assertLogs('news.images', 'WARNING') as logs:
+            self.assertIsNone(store_image(f'{self.base_url}/malformed/a.png'))
+            with mock.patch('news.images.default_storage.save', side_effect=OSError('disk full')):
+                self.assertIsNone(store_image(f'{self.base_url}/a.png'))
+        self.assertEqual(len(logs.records), 2)
+
+
+class ImageVariantTests(TempMediaMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        api_cache().clear()
+        self.name = default_storage.save(hashed_name('ab' * 32, '.png'),
+                                         ContentFile(png((1600, 900))))
+
+    def test_every_size_and_format_is_rendered(self):
+        variants = ensure_variants(self.name)
+        self.assertEqual(set(variants), set(VARIANTS))
+        for size, formats in variants.items():
+            self.assertEqual(set(formats), set(FORMATS))
+            for fmt, name in formats.items():
+                self.assertEqual(name, variant_name(self.name, size, fmt))
+                with default_storage.open(name) as fp, Image.open(fp) as image:
+                    self.assertEqual(image.format, FORMATS[fmt][0])
+                    # fitted into the box, keeping the 16:9 aspect
+                    box = VARIANTS[size]
+                    self.assertEqual(image.width, box[0])
+                    self.assertLessEqual(image.height, box[1])
+                    self.assertAlmostEqual(image.width / image.height, 16 / 9, places=1)
+
+        # stored variants are never rendered again
+        with mock.patch('news.images.render_variants') as render:
+            self.assertEqual(ensure_variants(self.name), variants)
+        render.assert_not_called()
+
+    def test_undecodable_original_has_no_variants(self):
+        name = default_storage.save(hashed_name('cd' * 32, '.jpg'), ContentFile(b'not an image'))
+        with self.assertLogs('news.images', 'WARNING'):
+            self.assertEqual(ensure_variants(name), {})
+
+    def test_urls_point_at_the_variants(self):
+        variants = ensure_variants(self.name)
+        with_variants = News.objects.create(
+            title='With', source='Ekantipur', source_key='ekantipur', url='https://ekantipur.com/1',
+            image=self.name, image_variants=variants)
+        News.objects.create(title='Without', source='Ekantipur', source_key='ekantipur',
+                            url='https://ekantipur.com/2', image=self.name)
+
+        cards = {item['title']: item for item in
+                 APIClient().get('/api/news/newslist/').json()['results']}
+        self.assertEqual(cards['With']['thumbnail'],
+                         f"http://testserver/media/{variants['thumb']['webp']}")
+        self.assertEqual(cards['Without']['thumbnail'], f'http://testserver/media/{self.name}')
+
+        detail = APIClient().get(f'/api/news/newslist/{with_variants.id}/').json()
+        self.assertEqual(detail['image_variants'], {
+            size: {fmt: f'http://testserver/media/{name}' for fmt, name in formats.items()}
+            for size, formats in variants.items()})
+
+
+class PersistArticlesTests(TestCase):
+
+    def article(self, i, title=None):
+        return {'url': f'https://ekantipur.com/news/{i}', 'title': title or f'Title {i}',
+                'summary': 'summary', 'content': 'content', 'author': 'author',
+                'created': '', 'source': 'Ekantipur', 'source_key': 'ekantipur'}
+
+    def counts(self, result):
+        return result.inserted, result.updated, result.skipped
+
+    def test_ingesting_a_batch_twice_updates_in_place(self):
+        batch = [self.article(i) for i in range(5)] + [
+            self.article(0, 'Repeated url'), {**self.article(5), 'title': ''},
+            {**self.article(6), 'url': ''}]
+        self.assertEqual(self.counts(persist_articles(batch, batch_size=2)), (5, 0, 3))
+        ids = dict(News.objects.values_list('url', 'id'))
+
+        batch[1] = self.article(1, 'Changed')
+        self.assertEqual(self.counts(persist_articles(batch, batch_size=2)), (0, 5, 3))
+        self.assertEqual(dict(News.objects.values_list('url', 'id')), ids)
+        self.assertEqual(News.objects.get(url=self.article(1)['url']).title, 'Changed')
+        self.assertEqual(News.objects.get(url=self.article(0)['url']).title, 'Title 0')
+
+
+class NewsApiTestMixin:
+    '''
+    A user and a few articles with comments for the API tests.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserProfile.objects.create_user(
+            'reader@example.com', 'Test Reader', 'Nepal', 'Others', 'password123')
+        cls.news = [News.objects.create(
+            title=f'Title {i}', summary='summary', content='content',
+            author='author', created='', source='Ekantipur', source_key='ekantipur',
+            url=f'https://ekantipur.com/news/{i}') for i in range(30)]
+        Comment.objects.bulk_create([Comment(user=cls.user, news=news, comment=f'comment {j}')
+                                     for news in cls.news for j in range(3)])
+        News.objects.update(comment_count=3)
+
+    def setUp(self):
+        self.client = APIClient()
+        api_cache().clear()
+
+
+class NewsListApiTests(NewsApiTestMixin, TestCase):
+
+    def test_list_query_count_does_not_grow_with_page_size(self):
+        for page_size in (5, 25):
+            with self.subTest(page_size=page_size), self.assertNumQueries(1):
+                response = self.client.get(
+                    '/api/news/newslist/', {'page_size': page_size})
+            self.assertEqual(len(response.json()['results']), page_size)
+
+    def test_list_items_are_compact(self):
+        item = self.client.get('/api/news/newslist/').json()['results'][0]
+        self.assertNotIn('content', item)
+        self.assertEqual(item['comment_count'], 3)
+        self.assertIn('thumbnail', item)
+
+    def test_sparse_fieldsets(self):
+        item = self.client.get(
+            '/api/news/newslist/', {'fields': 'id,title'}).json()['results'][0]
+        self.assertEqual(set(item), {'id', 'title'})
+
+    def test_detail_prefetches_comments(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/news/newslist/{self.news[0].id}/')
+        self.assertEqual(len(response.json()['comments']), 3)
+        self.assertNotIn('signature', response.json())
+        self.assertNotIn('search_length', response.json())
+
+
+SHARED_CACHE = {'default': {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': os.path.join(tempfile.gettempdir(), 'newsagg-test-cache'),
+}}
+
+
+@override_settings(CACHES=SHARED_CACHE)
+class ApiCacheTests(NewsApiTestMixin, TestCase):
+
+    def test_repeated_reads_skip_the_database(self):
+        first = self.client.get('/api/news/newslist/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/news/newslist/')
+        self.assertEqual(first.content, second.content)
+
+        stats = self.client.get('/api/news/cache/stats/').json()
+        self.assertGreaterEqual(stats['hits'], 1)
+        self.assertGreater(stats['hit_ratio'], 0)
+
+    def test_conditional_get_is_not_modified(self):
+        etag = self.client.get(f'/api/news/newslist/{self.news[0].id}/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/news/newslist/{self.news[0].id}/',
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_ingest_invalidates_cached_responses(self):
+        etag = self.client.get('/api/news/newslist/')['ETag']
+        articles = [{
+            'url': f'https://ekantipur.com/news/new{i}', 'title': f'Fresh {i}', 'summary': '',
+            'content': '', 'author': '', 'created': '', 'source': 'Ekantipur',
+            'source_key': 'ekantipur'} for i in range(2)]
+        # every batch invalidates as it commits, before images are downloaded
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            persist_articles(articles, batch_size=1)
+        self.assertEqual(callbacks, [apicache.bump_version] * 2)
+
+        response = self.client.get('/api/news/newslist/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['title'], 'Fresh 1')
+
+    def test_etag_follows_the_body(self):
+        etag = self.client.get('/api/news/newslist/')['ETag']
+        # a new version with the same data renders the same body
+        apicache.bump_version()
+        response = self.client.get('/api/news/newslist/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_per_process_cache_is_not_used(self):
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([warning.id for warning in apicache.check_cache(None)], ['news.W001'])
+            etag = self.client.get('/api/news/newslist/')['ETag']
+            # written by another process, whose version bump this one never sees
+            News.objects.create(title='Fresh', source='Ekantipur', source_key='ekantipur',
+                                url='https://ekantipur.com/news/new')
+
+            response = self.client.get('/api/news/newslist/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+            self.assertEqual(response.json()['results'][0]['title'], 'Fresh')
+        self.assertEqual(apicache.check_cache(None), [])
+
+    def test_comment_changes_invalidate_cached_responses(self):
+        url = f'/api/news/newslist/{self.news[0].id}/'
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/news/comments/create/{self.news[0].id}',
+                             {'user': self.user.id, 'news': self.news[0].id, 'comment': 'new'})
+        self.assertEqual(len(self.client.get(url).json()['comments']), 4)
+
+    def test_cached_responses_are_checked_first(self):
+        url = f'/api/news/newslist/{self.news[0].id}/'
+        etag = self.client.get(url)['ETag']
+        with mock.patch.object(NewsDetailApi, 'permission_classes', [IsAuthenticated]):
+            self.assertEqual(self.client.get(url).status_code, 401)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 401)
+
+    def test_requests_are_throttled_once(self):
+        allowed = []
+
+        class CountingThrottle(BaseThrottle):
+            def allow_request(self, request, view):
+                allowed.append(request.path)
+                return True
+
+        url = f'/api/news/newslist/{self.news[0].id}/'
+        with mock.patch.object(NewsDetailApi, 'throttle_classes', [CountingThrottle]):
+            self.client.get(url)
+            self.client.get(url)
+        self.assertEqual(allowed, [url, url])
+
+
+class CommentThreadTests(NewsApiTestMixin, TestCase):
+
+    def test_thread_is_paged_newest_first(self):
+        news = self.news[0]
+        start = timezone.now()
+        for comment in Comment.objects.filter(news=news):
+            Comment.objects.filter(id=comment.id).update(
+                created_at=start + datetime.timedelta(seconds=int(comment.comment[-1])))
+        with self.assertNumQueries(1):
+            page = self.client.get(f'/api/news/newslist/{news.id}/comments/',
+                                   {'page_size': 2}).json()
+        self.assertEqual([item['comment'] for item in page['results']],
+                         ['comment 2', 'comment 1'])
+        self.assertEqual({item['news'] for item in page['results']}, {news.id})
+
+        page = self.client.get(page['next']).json()
+        self.assertEqual([item['comment'] for item in page['results']], ['comment 0'])
+        self.assertIsNone(page['next'])
+
+    def test_comment_count_follows_creates_and_deletes(self):
+        news = self.news[0]
+        self.client.force_authenticate(self.user)
+        response = self.client.post(f'/api/news/comments/create/{news.id}',
+                                    {'user': self.user.id, 'news': news.id, 'comment': 'new'})
+        news.refresh_from_db()
+        self.assertEqual(news.comment_count, 4)
+
+        self.client.delete(f'/api/news/comments/delete/{response.json()["id"]}')
+        news.refresh_from_db()
+        self.assertEqual(news.comment_count, 3)
+
+
+class CommentPermissionTests(NewsApiTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.comment = Comment.objects.filter(user=self.user).first()
+        self.other = UserProfile.objects.create_user(
+            'other@example.com', 'Other Reader', 'Nepal', 'Others', 'password123')
+
+    def test_author_updates_in_one_lookup(self):
+        self.client.force_authenticate(self.user)
+        # the lookup, the update and the savepoint around them
+        with self.assertNumQueries(4):
+            response = self.client.patch(f'/api/news/comments/update/{self.comment.id}',
+                                         {'comment': 'edited'})
+        self.assertEqual(response.status_code, 200)
+        self.comment.refresh_from_db()
+        self.assertEqual(self.comment.comment, 'edited')
+
+    def test_other_users_comments_are_not_found(self):
+        self.client.force_authenticate(self.other)
+        with self.assertNumQueries(1):
+            response = self.client.delete(f'/api/news/comments/delete/{self.comment.id}')
+        self.assertEqual(response.status_code, 404)
+        self.assertTrue(Comment.objects.filter(id=self.comment.id).exists())
+
+    def test_missing_comment_is_not_found(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.delete('/api/news/comments/delete/999999')
+        self.assertEqual(response.status_code, 404)
+
+
+class ExportTests(NewsApiTestMixin, TestCase):
+
+    def test_ndjson_export_streams_and_resumes(self):
+        response = self.client.get('/api/news/export/', {'after': self.news[27].id})
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.news[28].id, self.news[29].id])
+        self.assertEqual(rows[0]['source_key'], 'ekantipur')
+
+    def test_csv_export_filters_by_source(self):
+        response = self.client.get('/api/news/export/', {'format': 'csv', 'source': 'nagarik'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(lines[0].startswith('id,url,source'))
+
+    def test_command_writes_every_row(self):
+        out = io.StringIO()
+        call_command('export_news', chunk_size=7, stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 30)
+
+    def test_bad_parameters_are_rejected(self):
+        self.assertEqual(self.client.get('/api/news/export/', {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/news/export/', {'after': 'x'}).status_code, 400)
+
+
+class SourceFeedTests(NewsApiTestMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        News.objects.create(
+            title='Nagarik', summary='summary', content='as reported by ekantipur',
+            author='author', created='', source='Nagarik News', source_key='nagarik',
+            url='https://nagariknews.nagariknetwork.com/news/1')
+
+    def test_source_feed_matches_the_source_only(self):
+        with self.assertNumQueries(1):
+            results = self.client.get('/api/news/sources/nagarik/news/').json()['results']
+        self.assertEqual([item['title'] for item in results], ['Nagarik'])
+
+        results = self.client.get(
+            '/api/news/sources/ekantipur/news/', {'page_size': 100}).json()['results']
+        self.assertEqual(len(results), 30)
+        self.assertNotIn('Nagarik', [item['title'] for item in results])
+
+    def test_source_keys_are_case_insensitive(self):
+        results = self.client.get('/api/news/newslist/', {'source': 'Nagarik'}).json()['results']
+        self.assertEqual(len(results), 1)
+
+    def test_unknown_source_is_not_found(self):
+        self.assertEqual(self.client.get('/api/news/sources/bbc/news/').status_code, 404)
+
+    def test_sources_are_listed(self):
+        keys = [source['key'] for source in self.client.get('/api/news/sources/').json()]
+        self.assertEqual(keys, list(SOURCES))
+
+
+class SearchTests(TestCase):
+
+    def article(self, i, title, content, summary='सारांश'):
+        return {'url': f'https://ekantipur.com/news/{i}', 'title': title,
+                'summary': summary, 'content': content, 'author': '',
+                'created': '', 'source': 'Ekantipur', 'source_key': 'ekantipur'}
+
+    def setUp(self):
+        api_cache().clear()
+
+    def search(self, query):
+        return APIClient().get('/api/news/search/', {'q': query})
+
+    def test_tokenizer_folds_nepali_variants(self):
+        self.assertEqual(tokenize('नेपालमा २०७९ सालको'), ['नेपाल', '2079', 'साल'])
+        self.assertEqual(tokenize('सरकारहरू'), tokenize('सरकारहरु'))
+        self.assertEqual(tokenize('गर्\u200dयो'), tokenize('गर्यो'))
+        self.assertEqual(tokenize('र पनि The'), [])
+
+    def test_ingest_keeps_the_index_current(self):
+        persist_articles([self.article(1, 'पुरानो शीर्षक', 'बाढीले क्षति')])
+        self.assertEqual(self.search('बाढी').json()['count'], 1)
+
+        persist_articles([self.article(1, 'नयाँ शीर्षक', 'पहिरोले क्षति')])
+        self.assertEqual(self.search('बाढी').json()['count'], 0)
+        self.assertEqual(self.search('पहिरो').json()['count'], 1)
+
+    def test_results_are_ranked_with_snippets(self):
+        persist_articles([
+            self.article(1, 'खेलकुद समाचार', 'आज निर्वाचन भयो र धेरै मानिस आए'),
+            self.article(2, 'निर्वाचन आयोगको घोषणा', 'निर्वाचनको मिति तोकियो'),
+            self.article(3, 'मौसम', 'आज पानी पर्‍यो'),
+        ])
+        results = self.search('निर्वाचन').json()['results']
+        self.assertEqual([item['title'] for item in results],
+                         ['निर्वाचन आयोगको घोषणा', 'खेलकुद समाचार'])
+        self.assertEqual(results[0]['highlight'], '<mark>निर्वाचन</mark> आयोगको घोषणा')
+        self.assertIn('<mark>निर्वाचनको</mark>', results[0]['snippet'])
+        self.assertGreater(results[0]['score'], results[1]['score'])
+
+    def test_every_query_term_must_match(self):
+        persist_articles([self.article(1, 'बाढी', 'पहिरो'), self.article(2, 'बाढी', 'भूकम्प')])
+        self.assertEqual(self.search('बाढी पहिरो').json()['count'], 1)
+        self.assertEqual(self.search('बाढी हिमपात').json()['count'], 0)
+
+    def test_query_is_required(self):
+        self.assertEqual(self.search(' ').status_code, 400)
+
+
+class PublishedAtTests(NewsApiTestMixin, TestCase):
+
+    def test_source_formats_are_parsed(self):
+        nepal = datetime.timezone(datetime.timedelta(hours=5, minutes=45))
+        reference = datetime.datetime(2023, 1, 30, 12, tzinfo=datetime.timezone.utc)
+        for text, expected in [
+            ('माघ १६, २०७९', datetime.datetime(2023, 1, 30, tzinfo=nepal)),
+            ('२०७९ माघ १६ गते १०:१५', datetime.datetime(2023, 1, 30, 10, 15, tzinfo=nepal)),
+            ('बिहिबार, पुस २८, २०८० ०७:४५', datetime.datetime(2024, 1, 13, 7, 45, tzinfo=nepal)),
+            ('३ घण्टा अगाडि', reference - datetime.timedelta(hours=3)),
+            ('January 30, 2023 3:15 pm', datetime.datetime(2023, 1, 30, 15, 15, tzinfo=nepal)),
+            ('चैत ३१, २०७९', None),
+            ('', None),
+        ]:
+            with self.subTest(text=text):
+                self.assertEqual(parse_published(text, reference), expected)
+
+    def test_new_years_day(self):
+        self.assertEqual(bs_to_ad(2080, 1, 1), datetime.date(2023, 4, 14))
+        self.assertEqual(bs_to_ad(2081, 1, 1), datetime.date(2024, 4, 13))
+
+    def test_backfill_and_range_filter(self):
+        News.objects.filter(id=self.news[0].id).update(created='माघ १६, २०७९')
+        News.objects.filter(id=self.news[1].id).update(created='२०७९ माघ १७ गते ०९:००')
+        with CaptureQueriesContext(connection) as queries:
+            call_command('backfill_published_at', batch_size=7, stdout=io.StringIO())
+        # one select per batch of seven and the empty last one, none per row
+        selects = [query for query in queries if query['sql'].startswith('SELECT')]
+        self.assertEqual(len(selects), 6)
+
+        # dates without an offset are read in TIME_ZONE, so the range names Nepal's
+        response = self.client.get('/api/news/newslist/', {
+            'published_after': '2023-01-30T00:00:00+05:45',
+            'published_before': '2023-02-01T00:00:00+05:45',
+            'ordering': '-published_at'})
+        self.assertEqual([item['id'] for item in response.json()['results']],
+                         [self.news[1].id, self.news[0].id])
+
+    def test_bad_range_is_rejected(self):
+        response = self.client.get('/api/news/newslist/', {'published_after': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+
+class StoryTests(TestCase):
+    STORY = ('काठमाडौं महानगरपालिकाले साउन १ गतेदेखि सार्वजनिक यातायातमा '
+             'विद्युतीय बस सञ्चालन गर्ने निर्णय गरेको छ। नगर प्रमुखका अनुसार '
+             'पहिलो चरणमा पचास वटा बस किनिनेछन् र चार्जिङ स्टेसन निर्माण हुनेछ।')
+
+    def setUp(self):
+        api_cache().clear()
+
+    def article(self, source, i, title, content):
+        return {'url': f'https://{source}.com/news/{i}', 'title': title,
+                'summary': '', 'content': content, 'author': '', 'created': '',
+                'source': source, 'source_key': source}
+
+    def test_the_same_story_from_two_sources_is_clustered(self):
+        persist_articles([self.article('ekantipur', 1, 'विद्युतीय बस सञ्चालन गर्ने निर्णय', self.STORY)])
+        persist_articles([
+            self.article('nagarik', 1, 'महानगरमा विद्युतीय बस',
+                         self.STORY.replace('पचास', 'साठी') + ' थप विवरण आउन बाँकी छ।'),
+            self.article('nagarik', 2, 'मौसम', 'आज देशभर मौसम सफा रहने मौसम विज्ञान '
+                         'महाशाखाले जनाएको छ। पहाडी भेगमा हल्का वर्षा हुन सक्छ।'),
+        ])
+
+        first, second, weather = News.objects.order_by('id')
+        self.assertIsNotNone(first.story_id)
+        self.assertEqual(first.story_id, second.story_id)
+        self.assertIsNone(weather.story_id)
+
+        stories = APIClient().get('/api/news/stories/').json()['results']
+        self.assertEqual([len(story['articles']) for story in stories], [2])
+
+    def test_story_list_queries_do_not_grow_with_stories(self):
+        for i in range(3):
+            content = ' '.join(f'शब्द{i}x{j}' for j in range(20))
+            persist_articles([self.article('ekantipur', i, 'शीर्षक', content),
+                              self.article('nagarik', i, 'शीर्षक', content)])
+        self.assertEqual(Story.objects.count(), 3)
+        with self.assertNumQueries(2):
+            stories = APIClient().get('/api/news/stories/').json()['results']
+        self.assertEqual([len(story['articles']) for story in stories], [2, 2, 2])
+
+
+class FixtureFetcher:
+    '''
+    Serves the fixture pages of a source in place of the network.
+    '''
+
+    def __init__(self, key, failing=()):
+        self.key = key
+        self.failing = set(failing)
+        self.fetched = []
+
+    def get_text(self, url, ttl=0):
+        return fixture_page(f'{self.key}_home.html')
+
+    def fetch_all(self, urls, ttl=0):
+        self.fetched.extend(urls)
+        return [None if url in self.failing else fixture_page(f'{self.key}_article.html')
+                for url in urls]
+
+    def stats(self):
+        return {}
+
+
+class EngineTests(TestCase):
+
+    def scrape(self, key):
+        fetcher = FixtureFetcher(key)
+        with mock.patch.object(engine, 'fetcher', fetcher):
+            return list(engine.iter_articles(SOURCES[key])), fetcher
+
+    def test_articles_match_the_per_site_scrapers(self):
+        # what the scrapers the source specs replaced made of the fixture
+        # pages, with the content as its sha1
+        with open(os.path.join(TESTDATA, 'expected_articles.json'), encoding='utf-8') as fp:
+            expected = json.load(fp)
+        self.assertEqual(set(expected), set(SOURCES))
+        for key, articles in expected.items():
+            with self.subTest(source=key):
+                scraped = []
+                for article in self.scrape(key)[0]:
+                    fields = article.as_fields()
+                    self.assertEqual(fields.pop('source_key'), key)
+                    fields['content_sha1'] = hashlib.sha1(fields.pop('content').encode()).hexdigest()
+                    scraped.append(fields)
+                self.assertEqual(scraped, articles)
+
+    def test_known_urls_are_not_fetched(self):
+        listing = [item['url'] for item in
+                   parse_listing(SOURCES['nagarik'], fixture_page('nagarik_home.html'))]
+        for url in listing[:3]:
+            News.objects.create(title='Stored', source='Nagarik News', source_key='nagarik', url=url)
+
+        with self.assertNumQueries(1):
+            articles, fetcher = self.scrape('nagarik')
+        self.assertEqual(fetcher.fetched, listing[3:])
+        self.assertEqual([article.url for article in articles], listing[3:])
+
+        with mock.patch('news.ingest.ingest_image', return_value=None):
+            persist_articles([article.as_fields() for article in articles])
+        fetcher.fetched = []
+        with mock.patch.object(engine, 'fetcher', fetcher):
+            self.assertEqual(list(engine.iter_articles(SOURCES['nagarik'])), [])
+        self.assertEqual(fetcher.fetched, [])
+
+
+class MissingArticleTests(LocalSiteMixin, TestCase):
+    handler = NewsSiteHandler
+
+    def test_error_pages_are_skipped_and_not_stored(self):
+        spec = dataclasses.replace(SOURCES['nagarik'], homepage=f'{self.base_url}/')
+        gone = f'{self.base_url}/news/98700-0'
+        with mock.patch.object(engine, 'fetcher', Fetcher(policy=RetryPolicy(attempts=1))), \
+                mock.patch('news.ingest.ingest_image', return_value=None), \
+                self.assertLogs('news.fetch', 'WARNING') as logs:
+            result = engine.scrape(spec)
+
+        self.assertIn(gone, logs.output[0])
+        self.assertEqual(result.skipped, 1)
+        self.assertGreater(result.inserted, 0)
+        self.assertFalse(News.objects.filter(url=gone).exists())
+        self.assertFalse(News.objects.filter(content='').exists())
+
+    def test_pages_without_content_are_not_articles(self):
+        listing = {'url': 'https://nagariknews.nagariknetwork.com/news/98700-0', 'title': 'Gone story'}
+        self.assertIsNone(parse_detail(SOURCES['nagarik'], listing,
+                                       '<html><body><h1>Page not found</h1></body></html>'))
+
+
+class ScrapeMetricsTests(TestCase):
+
+    def setUp(self):
+        api_cache().clear()
+
+    def scrape_job(self, key, failing=()):
+        job = ScrapeJob.objects.create(source=key, status=ScrapeJob.RUNNING,
+                                       started_at=timezone.now())
+        with mock.patch.object(engine, 'fetcher', FixtureFetcher(key, failing)), \
+                mock.patch('news.ingest.ingest_image', return_value=None):
+            return jobs.run_job(job)
+
+    def test_render_format(self):
+        counter = metrics.Counter('test_render_total', 'A counter.', ['source'])
+        histogram = metrics.Histogram('test_render_seconds', 'A histogram.', ['stage'],
+                                      buckets=(0.1, 1))
+        try:
+            counter.inc(2, source='say "hi"')
+            histogram.observe(0.5, stage='parse')
+            histogram.observe(3, stage='parse')
+            text = metrics.render()
+        finally:
+            metrics.REGISTRY.remove(counter)
+            metrics.REGISTRY.remove(histogram)
+
+        self.assertIn('# TYPE test_render_total counter\n'
+                      'test_render_total{source="say \\"hi\\""} 2\n', text)
+        self.assertIn('test_render_seconds_bucket{stage="parse",le="0.1"} 0\n'
+                      'test_render_seconds_bucket{stage="parse",le="1"} 1\n'
+                      'test_render_seconds_bucket{stage="parse",le="+Inf"} 2\n'
+                      'test_render_seconds_sum{stage="parse"} 3.5\n'
+                      'test_render_seconds_count{stage="parse"} 2\n', text)
+
+    def test_render_keeps_large_values_exact(self):
+        counter = metrics.Counter('test_render_bytes_total', 'A counter.', ['kind'])
+        try:
+            counter.inc(1234567890, kind='int')
+            counter.inc(1234567.891, kind='float')
+            text = metrics.render()
+        finally:
+            metrics.REGISTRY.remove(counter)
+
+        self.assertIn('test_render_bytes_total{kind="int"} 1234567890\n', text)
+        self.assertIn('test_render_bytes_total{kind="float"} 1234567.891\n', text)
+
+    def test_scrape_stages_are_timed_and_counted(self):
+        stages = ['fetch_homepage', 'parse_listing', 'lookup', 'fetch_detail',
+                  'parse_detail', 'write', 'image', 'persist']
+        before = {stage: metrics.SCRAPE_STAGE_SECONDS.count(source='nagarik', stage=stage)
+                  for stage in stages}
+        inserted = metrics.SCRAPE_ARTICLES.value(source='nagarik', outcome='inserted')
+        skipped = metrics.SCRAPE_ERRORS.value(source='nagarik', stage='fetch_detail')
+        done = metrics.SCRAPE_JOBS.value(source='nagarik', status=ScrapeJob.DONE)
+
+        listing = parse_listing(SOURCES['nagarik'], fixture_page('nagarik_home.html'))
+        job = self.scrape_job('nagarik', failing=[listing[0]['url']])
+
+        self.assertEqual(job.status, ScrapeJob.DONE)
+        self.assertEqual(set(job.stage_seconds), set(stages))
+        for stage in stages:
+            self.assertGreater(metrics.SCRAPE_STAGE_SECONDS.count(source='nagarik', stage=stage),
+                               before[stage])
+        self.assertEqual(metrics.SCRAPE_ARTICLES.value(source='nagarik', outcome='inserted')
+                         - inserted, job.items_inserted)
+        self.assertEqual(metrics.SCRAPE_ERRORS.value(source='nagarik', stage='fetch_detail')
+                         - skipped, 1)
+        self.assertEqual(metrics.SCRAPE_JOBS.value(source='nagarik', status=ScrapeJob.DONE)
+                         - done, 1)
+
+        text = APIClient().get('/api/news/metrics/').content.decode()
+        self.assertIn('newsagg_scrape_stage_seconds_count{source="nagarik",stage="persist"}', text)
+
+    def test_json_log_lines_carry_the_extra_fields(self):
+        record = logging.makeLogRecord({'name': 'news.engine', 'levelname': 'INFO',
+                                        'msg': 'Scraped %s', 'args': ('Nagarik',),
+                                        'source': 'nagarik', 'stage_seconds': {'lookup': 0.01}})
+        entry = json.loads(metrics.JsonFormatter().format(record))
+        self.assertEqual(entry['message'], 'Scraped Nagarik')
+        self.assertEqual(entry['source'], 'nagarik')
+        self.assertEqual(entry['stage_seconds'], {'lookup': 0.01})
+
+
+@override_settings(API_PROFILING=True)
+@modify_settings(MIDDLEWARE={'append': 'news.profiling.ProfilingMiddleware'})
+class ProfilingTests(NewsApiTestMixin, TestCase):
+
+    def timings(self, response):
+        return dict(metric.split(';', 1) for metric in response['Server-Timing'].split(', '))
+
+    def test_server_timing_reports_queries(self):
+        endpoint = '/api/news/newslist/'
+        before = profiling.REQUEST_SECONDS.count(endpoint=endpoint, method='GET')
+        response = self.client.get('/api/news/newslist/')
+        timings = self.timings(response)
+        self.assertEqual(set(timings), {'total', 'db', 'dup'})
+        self.assertIn('desc="1 queries"', timings['db'])
+        self.assertEqual(timings['dup'], 'desc="0 duplicate queries"')
+        self.assertEqual(profiling.REQUEST_SECONDS.count(endpoint=endpoint, method='GET'),
+                         before + 1)
+
+    @override_settings(API_SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged_with_fingerprints(self):
+        with self.assertLogs('news.profiling', 'WARNING') as logs:
+            self.client.get(f'/api/news/newslist/{self.news[0].id}/comments/')
+        record = logs.records[0]
+        self.assertEqual(record.endpoint, '/api/news/newslist/<int:pk>/comments/')
+        self.assertEqual(record.queries, sum(shape['count'] for shape in record.fingerprints))
+
+    @override_settings(API_PROFILING=False)
+    def test_off_by_default(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/news/newslist/'))
+
+    def test_repeated_query_shapes_are_duplicates(self):
+        log = profiling.QueryLog()
+        for ids in ([1], [1, 2, 3]):
+            placeholders = ', '.join(['%s'] * len(ids))
+            log(lambda *args: None, f'SELECT * FROM news WHERE id IN ({placeholders})',
+                ids, False, {})
+        log(lambda *args: None, 'SELECT  COUNT(*)\n FROM news', [], False, {})
+        self.assertEqual(log.count, 3)
+        self.assertEqual(log.duplicates, 1)
+        self.assertEqual(log.top(1)[0]['sql'], 'SELECT * FROM news WHERE id IN (...)')
+
+
+@override_settings(NEWS_EVENTS_BROADCASTER='news.events.LocalBroadcaster')
+class EventStreamTests(NewsApiTestMixin, TestCase):
+
+    def stream(self, query=b'', headers=(), events=()):
+        '''
+        Opens the event stream, publishes `events` once it is listening, then
+        disconnects and returns the status and body sent.
+        '''
+        async def run():
+            broadcaster = get_broadcaster()
+            disconnect = asyncio.Event()
+            sent = []
+
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {'type': 'http', 'path': EVENTS_PATH, 'query_string': query,
+                     'headers': list(headers)}
+            task = asyncio.ensure_future(event_stream(scope, receive, send))
+            while not broadcaster.listeners and not task.done():
+                await asyncio.sleep(0.001)
+            for event in events:
+                broadcaster.publish(event)
+            await asyncio.sleep(0.01)
+            disconnect.set()
+            await task
+            self.assertFalse(broadcaster.listeners)
+            return sent[0]['status'], b''.join(message.get('body', b'') for message in sent[1:])
+
+        return async_to_sync(run)()
+
+    def test_articles_are_pushed_to_subscribers_of_their_source(self):
+        status, body = self.stream(b'sources=nagarik', events=[
+            {'id': 1000, 'source': 'ekantipur', 'title': 'one', 'published_at': None},
+            {'id': 1001, 'source': 'nagarik', 'title': 'two', 'published_at': None},
+        ])
+        self.assertEqual(status, 200)
+        self.assertEqual(body.decode(), 'retry: 5000\n\n'
+                         'id: 1001\nevent: article\ndata: {"id": 1001, "source": "nagarik", '
+                         '"title": "two", "published_at": null}\n\n')
+
+    def test_reconnect_replays_missed_articles(self):
+        status, body = self.stream(headers=[(b'last-event-id', str(self.news[27].id).encode())],
+                                   events=[{'id': self.news[29].id, 'source': 'ekantipur',
+                                            'title': 'Title 29', 'published_at': None}])
+        ids = [int(line[4:]) for line in body.decode().splitlines() if line.startswith('id: ')]
+        self.assertEqual(ids, [self.news[28].id, self.news[29].id])
+
+    def test_unknown_sources_are_rejected(self):
+        status, body = self.stream(b'sources=nagarik,bbc')
+        self.assertEqual(status, 400)
+
+    def test_polling_broadcaster_publishes_committed_articles(self):
+        async def run():
+            broadcaster = PollingBroadcaster(interval=0.01)
+            async with broadcaster.listen(['nagarik']) as listener:
+                await asyncio.sleep(0.05)
+                await sync_to_async(News.objects.create)(
+                    title='New', url='https://nagarik.com/news/new', source='Nagarik',
+                    source_key='nagarik')
+                event = await asyncio.wait_for(listener.get(), 2)
+            self.assertFalse(broadcaster._tasks)
+            return event
+
+        event = async_to_sync(run)()
+        self.assertEqual((event['source'], event['title']), ('nagarik', 'New'))
+
+    def test_polling_broadcaster_publishes_late_commits_below_the_latest_id(self):
+        def create(id, title):
+            News.objects.create(id=id, title=title, url=f'https://nagarik.com/news/{id}',
+                                source='Nagarik', source_key='nagarik')
+
+        async def run():
+            broadcaster = PollingBroadcaster(interval=0.01)
+            after = await sync_to_async(latest_id)()
+            async with broadcaster.listen(['nagarik']) as listener:
+                await asyncio.sleep(0.05)
+                await sync_to_async(create)(after + 2, 'Committed first')
+                first = await asyncio.wait_for(listener.get(), 2)
+                await sync_to_async(create)(after + 1, 'Committed late')
+                second = await asyncio.wait_for(listener.get(), 2)
+            return first, second
+
+        first, second = async_to_sync(run)()
+        self.assertEqual([first['title'], second['title']], ['Committed first', 'Committed late'])
+
+    def test_truncated_replay_ends_the_stream(self):
+        with mock.patch('news.events.REPLAY_LIMIT', 1):
+            status, body = self.stream(
+                headers=[(b'last-event-id', str(self.news[27].id).encode())],
+                events=[{'id': self.news[29].id + 1, 'source': 'ekantipur',
+                         'title': 'Live', 'published_at': None}])
+        ids = [int(line[4:]) for line in body.decode().splitlines() if line.startswith('id: ')]
+        self.assertEqual(ids, [self.news[28].id])
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def test_concurrent_misses_compute_once(self):
+        cache = LocMemCache('single-flight-tests', {})
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'value'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            single_flight(cache, 'key', compute, 60))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['value'] * 8)
+        self.assertIsNone(cache.get('key:lock'))
+
+    def test_uncacheable_values_are_computed_by_every_caller(self):
+        cache = LocMemCache('single-flight-tests', {})
+        calls = []
+        for _ in range(2):
+            self.assertIsNone(single_flight(cache, 'missing', lambda: calls.append(1), 60))
+        self.assertEqual(len(calls), 2)
+
+    def test_waiting_gives_up_on_a_stuck_holder(self):
+        cache = LocMemCache('single-flight-tests', {})
+        cache.add('stuck:lock', True, 60)
+        start = time.monotonic()
+        self.assertEqual(single_flight(cache, 'stuck', lambda: 'own', 60, wait=0.05), 'own')
+        self.assertLess(time.monotonic() - start, 1)
+
+
+class ScrapeTriggerTests(TestCase):
+
+    def trigger(self, source='nagarik'):
+        return APIClient().post(f'/api/news/scrape/{source}/')
+
+    def test_requests_attach_to_the_active_job(self):
+        first, second = self.trigger(), self.trigger()
+        self.assertEqual((first.status_code, second.status_code), (202, 202))
+        self.assertEqual(first.json()['id'], second.json()['id'])
+        self.assertEqual(ScrapeJob.objects.count(), 1)
+
+        ScrapeJob.objects.update(status=ScrapeJob.RUNNING)
+        self.assertEqual(self.trigger().json()['id'], first.json()['id'])
+        self.assertEqual(self.trigger('ekantipur').status_code, 202)
+        self.assertEqual(ScrapeJob.objects.count(), 2)
+
+    def test_a_fresh_result_is_returned_instead_of_scraping_again(self):
+        now = timezone.now()
+        done = ScrapeJob.objects.create(source='nagarik', status=ScrapeJob.DONE,
+                                        started_at=now, finished_at=now)
+        response = self.trigger()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['id'], done.id)
+
+        ScrapeJob.objects.update(finished_at=now - datetime.timedelta(minutes=5))
+        response = self.trigger()
+        self.assertEqual(response.status_code, 202)
+        self.assertNotEqual(response.json()['id'], done.id)
+
+    def test_unknown_sources_are_not_found(self):
+        self.assertEqual(self.trigger('bbc').status_code, 404)
+
+    def test_get_does_not_queue(self):
+        self.assertEqual(APIClient().get('/api/news/scrape/nagarik/').status_code, 405)
+        self.assertEqual(APIClient().get('/api/news/nagarikscraper/').status_code, 405)
+        self.assertFalse(ScrapeJob.objects.exists())
+
+    def test_queued_job_can_be_followed(self):
+        job = APIClient().post('/api/news/nagarikscraper/').json()
+        self.assertEqual((job['source'], job['status']), ('nagarik', ScrapeJob.QUEUED))
+
+        ScrapeJob.objects.filter(id=job['id']).update(
+            status=ScrapeJob.DONE, items_inserted=4, finished_at=timezone.now())
+        response = APIClient().get(f"/api/news/scrape/jobs/{job['id']}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['status'], response.json()['items_inserted']),
+                         (ScrapeJob.DONE, 4))
+        self.assertEqual(APIClient().get('/api/news/scrape/jobs/999999/').status_code, 404)
+
+
+class SourceLeaseTests(TestCase):
+    '''
+    Several workers sharing the sources through one database, with the clock
+    passed in so that leases can be let expire.
+    '''
+    start = timezone.now()
+
+    def at(self, seconds):
+        return self.start + datetime.timedelta(seconds=seconds)
+
+    def workers(self, *names):
+        return [Coordinator(name, ttl=60) for name in names]
+
+    def beat(self, workers, seconds):
+        # a second round lets everyone see the workers that joined in the first
+        for _ in range(2):
+            held = {worker.name: worker.heartbeat(self.at(seconds)) for worker in workers}
+        return held
+
+    def assertPartition(self, held):
+        sources = [source for leased in held.values() for source in leased]
+        self.assertCountEqual(sources, SOURCES)
+
+    def test_sources_are_spread_over_the_workers(self):
+        held = self.beat(self.workers('a', 'b', 'c'), 0)
+        self.assertPartition(held)
+        self.assertEqual([len(leased) for leased in held.values()], [1, 1, 1])
+
+    def test_a_dead_workers_sources_are_taken_over(self):
+        a, b, c = self.workers('a', 'b', 'c')
+        held = self.beat([a, b, c], 0)
+        lost = next(iter(held['a']))
+        job = ScrapeJob.objects.create(source=lost, status=ScrapeJob.RUNNING, worker='a',
+                                       started_at=self.at(0))
+
+        # `a` stops beating; its lease outlives it by the ttl
+        self.assertEqual(self.beat([b, c], 30), {'b': held['b'], 'c': held['c']})
+        with self.assertLogs('news.leases', 'WARNING') as logs:
+            held = self.beat([b, c], 61)
+        self.assertPartition(held)
+        self.assertIn(lost, held['b'] | held['c'])
+        [record] = logs.records
+        self.assertEqual((record.event, record.source, record.previous, record.orphaned_jobs),
+                         ('lease_takeover', lost, 'a', 1))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ScrapeJob.FAILED)
+        # the source can be queued again
+        self.assertEqual(jobs.enqueue(lost).status, ScrapeJob.QUEUED)
+
+    def test_a_restarted_worker_fails_its_stale_jobs(self):
+        a, = self.workers('a')
+        source = next(iter(self.beat([a], 0)['a']))
+        job = ScrapeJob.objects.create(source=source, status=ScrapeJob.RUNNING, worker='a',
+                                       started_at=self.at(0))
+        # a live worker's next beat leaves its job alone
+        a.heartbeat(self.at(5))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ScrapeJob.RUNNING)
+
+        # crashed and restarted with the same --name, before its lease expired
+        a, = self.workers('a')
+        with self.assertLogs('news.leases', 'WARNING') as logs:
+            self.assertIn(source, a.heartbeat(self.at(10)))
+        [record] = logs.records
+        self.assertEqual((record.event, record.worker, record.jobs), ('stale_jobs', 'a', 1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, ScrapeJob.FAILED)
+        self.assertEqual(jobs.enqueue(source).status, ScrapeJob.QUEUED)
+
+    def test_a_new_worker_gets_a_share(self):
+        a, b = self.workers('a', 'b')
+        held = self.beat([a, b], 0)
+        self.assertEqual(sorted(len(leased) for leased in held.values()), [1, 2])
+
+        c, = self.workers('c')
+        held = self.beat([a, b, c], 10)
+        self.assertPartition(held)
+        self.assertEqual([len(leased) for leased in held.values()], [1, 1, 1])
+
+    def test_workers_only_run_jobs_of_their_sources(self):
+        a, b = self.workers('a', 'b')
+        self.beat([a, b], 0)
+        queued = {source: jobs.enqueue(source) for source in SOURCES}
+        with mock.patch('news.jobs.run_job', side_effect=lambda job: job):
+            ran = {worker.name: jobs.run_pending_jobs(worker) for worker in (a, b)}
+
+        for worker in (a, b):
+            self.assertEqual({job.source for job in ran[worker.name]}, worker.sources)
+            self.assertTrue(all(job.worker == worker.name for job in ran[worker.name]))
+        self.assertEqual(sum(map(len, ran.values())), len(queued))
+
+    def test_random_interleavings_never_share_a_source(self):
+        rng = random.Random(7)
+        workers = self.workers('a', 'b', 'c', 'd', 'e')
+        alive = set(workers)
+        with self.assertLogs('news.leases', 'WARNING') as logs:
+            for second in range(0, 1500, 15):
+                if rng.random() < 0.1 and len(alive) > 1:
+                    alive.discard(rng.choice(sorted(alive, key=lambda worker: worker.name)))
+                elif rng.random() < 0.1:
+                    alive.add(rng.choice(workers))
+                for worker in rng.sample(sorted(alive, key=lambda worker: worker.name), len(alive)):
+                    worker.heartbeat(self.at(second))
+
+                held = [source for worker in alive for source in worker.sources]
+                self.assertEqual(len(held), len(set(held)), f'shared at {second}s')
+            # once the dead leases expire the survivors hold everything
+            self.assertPartition(self.beat(alive, 1500 + 61))
+        # a worker never takes a lease over from itself
+        for record in logs.records:
+            self.assertEqual(record.event, 'lease_takeover')
+            self.assertNotEqual(record.worker, record.previous)
+
+    def test_release_frees_the_sources(self):
+        a, b = self.workers('a', 'b')
+        self.beat([a, b], 0)
+        a.release()
+        self.assertFalse(SourceLease.objects.filter(owner='a').exists())
+        self.assertPartition(self.beat([b], 1))
 
-# Create your tests here.
@@ -7,15 +7,34 @@ app_name = 'news'
 
 urlpatterns = [
     path('newslist/', views.NewsListApi.as_view(), name='newsList'),
-    path('ekanscraper/', views.scraperEkantipur, name='ekanscraper'),
-    path('onlinekhabarscraper/', views.scraper_onlinekhabar, name='online-khabar'),
-    path('nagarikscraper/', views.nagarik_scraper, name='nagarik-scraper'),
+    path('ekanscraper/', views.trigger_scrape,
+         {'source': 'ekantipur'}, name='ekanscraper'),
+    path('onlinekhabarscraper/', views.trigger_scrape,
+         {'source': 'onlinekhabar'}, name='online-khabar'),
+    path('nagarikscraper/', views.trigger_scrape,
+         {'source': 'nagarik'}, name='nagarik-scraper'),
+    path('sources/', views.source_list, name='sources'),
+    path('cache/stats/', views.cache_stats, name='cacheStats'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('sources/<slug:source>/news/', views.NewsListApi.as_view(),
+         name='sourceNews'),
+    path('scrape/<str:source>/', views.trigger_scrape, name='scrape'),
+    path('scrape/jobs/<int:pk>/', views.ScrapeJobDetailApi.as_view(),
+         name='scrapeJob'),
     path('newslist/', views.NewsListApi.as_view(), name='newsList'),
+    path('search/', views.NewsSearchApi.as_view(), name='newsSearch'),
+    path('export/', views.export_news, name='export'),
+    path('stories/', views.StoryListApi.as_view(), name='stories'),
+    path('stories/<int:pk>/', views.StoryDetailApi.as_view(), name='story'),
     path('newslist/<int:pk>/', views.NewsDetailApi.as_view(), name='newsDetail'),
+    path('newslist/<int:pk>/comments/', views.NewsCommentsApi.as_view(),
+         name='newsComments'),
     path('comments/list', views.CommentsListApi.as_view(), name="newsList"),
     path('comments/create/<int:pk>',
          views.CommentCreateApi.as_view(), name='newsCreate'),
     path('comments/update/<int:pk>',
          views.CommentUpdateApi.as_view(), name='newsUpdate'),
+    path('comments/delete/<int:pk>',
+         views.CommentDeleteApi.as_view(), name='newsDelete'),
 
 ]
@@ -1,389 +1,299 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Prefetch
 from django.shortcuts import render, HttpResponse
-import requests
-from bs4 import BeautifulSoup
-from rest_framework import generics
-from .models import News, Comment
-from .serializers import CommentSerializer, NewsSerializer
-import time
-from rest_framework import generics
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from django.views.static import serve
+from rest_framework import generics, status
+from .models import News, Comment, ScrapeJob, Story
+from .serializers import CommentSerializer, NewsListSerializer, NewsSearchSerializer, NewsSerializer, ScrapeJobSerializer, StorySerializer
 from rest_framework import authentication, permissions
 from rest_framework import filters
+from rest_framework.decorators import api_view
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from .pagination import CommentCursorPagination, NewsCursorPagination, NewsSearchPagination, StoryCursorPagination
 from .permissions import IsTheCommentAuthor
-import urllib.request
-import tempfile
-from io import BytesIO
-from django.core import files
-from datetime import datetime, timedelta
+from . import apicache, export, jobs, metrics, search
+from .apicache import CachedResponseMixin
+from .dates import parse_iso
+from .sources import SOURCES
+from django.utils import timezone
+from datetime import timedelta
 
 
-def scraperEkantipur(request):
+@api_view(['GET'])
+def source_list(request):
     '''
-    This code scrapes the latest news section from the homepage of https://ekantipur.com/
+    The registered sources, whose keys name the per-source feeds.
     '''
-    while True:
-        try:
-            html = requests.get('https://ekantipur.com/').text
-            break
-
-        except:
-            print("Connection to the homepage failed, retrying in 15 seconds....")
-            time.sleep(15)
-
-    soup = BeautifulSoup(html, 'html.parser')
-    news_list = soup.find(
-        'section', class_='main-news layout3').find_all('article')
-    # Storing all the individual top news seperated in 'article' sections
-    title_links = []
-
-    title_links = [news.find('h1') for news in news_list if news != None]
-    # links containing title with <a> tag to the detail page
+    return Response([{'key': spec.key, 'name': spec.name, 'homepage': spec.homepage}
+                     for spec in SOURCES.values()])
 
-    titles = [link.find('a').text for link in title_links if link]
-
-    detail_links = [link.find('a')['href'] for link in title_links if link]
-    # this contains the individual links to detail page of all main news
-    summaries = [news.find('p')
-                 for news in news_list if news is not None]
-  
-    summary = [x for x in summaries if x]
-    # this list consists of summaries from other sections apart from the top news.
-
-    for y in summary:
-        if y.parent.parent.get('class')[0] != 'main-news':
-            y.decompose()
-
-    summ = [x.text for x in summary if x and len(x.text.strip())!=0]
-    for each in summ:
-        print(each + "\n" + "present" + "\n")
-           
-    contents, authors, timePublished, images = newsDetailEkantipur(
-        detail_links)
-    # obtaining the important fields from inside the detail page
-    contentsLst = []
 
+@api_view(['POST'])
+def trigger_scrape(request, source):
+    '''
+    Queues a scrape of `source` for the scrape worker and returns the job at
+    once. POST only, so link prefetchers and crawlers cannot start scrapes.
+    Requests while a scrape of the source is queued or running get that job,
+    and requests soon after one finished get the finished job with a 200, see
+    jobs.request_scrape.
+    '''
+    try:
+        job = jobs.request_scrape(source)
+    except KeyError:
+        return Response({'detail': f'Unknown source {source}.'}, status=status.HTTP_404_NOT_FOUND)
+    code = status.HTTP_202_ACCEPTED if job.status in ScrapeJob.ACTIVE else status.HTTP_200_OK
+    return Response(ScrapeJobSerializer(job).data, status=code)
 
-    for content in contents:
-        contentsStr = ""
-        for each in content:
-            contentsStr += each.text + "\n\n"
-        contentsLst.append(contentsStr)
-
-    imageIds = [link.split('/')[7].split('.')[0] for link in detail_links]
-    # getting the unique id of images
-
-    # '../media/posts_images/{imageIds[i]}.jpg'
-    print(len(titles),len(summ),len(contentsLst),len(authors),len(timePublished))
-
-    # get or create method, if the model doesn't exist, it will create
-    for i in range(len(images)):
-        try:
-            news = News.objects.get(title=titles[i])
-        except:
-
-            response = requests.get(images[i], stream=True)
-
-            if response.status_code != requests.codes.ok:
-                continue
-            filename = f"{imageIds[i]}.jpg"
-
-            fp = BytesIO()
-            fp.write(response.content)     
-            
-            
-
-            news = News(title=titles[i], summary=summ[i], content=contentsLst[i],
-                        author=authors[i], created=timePublished[i], source="Ekantipur")
-
-            news.save()
-            news.image.save(filename, files.File(fp))
-
-        # Write image block to temporary file
-
-    return HttpResponse(summ)
-
-
-def newsDetailEkantipur(detail_links):
-
-    authors = []
-    summaries = []
-    contentsLst = []
-    timePublished = []
-    images = []
-    for link in detail_links:
-
-        while True:
-            try:
-                html = requests.get(link).text
-                break
-
-            except:
-                print("Connection Failed, Retrying in 15 seconds....")
-                time.sleep(15)
-
-        soup = BeautifulSoup(html, 'html.parser')
-        mainNews = soup.find('div', class_='col-xs-10 col-sm-10 col-md-10')
-        author = mainNews.find('span', class_="author").text
-        contentList = mainNews.find_all('p')
-        timee = mainNews.find('time').text
-        imageSrc = mainNews.find('figure')
-        if imageSrc:
-            image = imageSrc.find('img')['data-src']
-
-            images.append(image)
-        authors.append(author)
-        timePublished.append(timee)
-        contentsLst.append(contentList)
-
-    return contentsLst, authors, timePublished, images
-
-
-def scraper_onlinekhabar(request):
-    while True:
-        try:
-            html = requests.get('https://www.onlinekhabar.com/').text
-            break
-
-        except:
-            print("Connect to the homepage failed, retrying in 15 seconds....")
-            time.sleep(15)
-
-    soup = BeautifulSoup(html, 'html.parser')
-    news_list = soup.find_all(
-        'section', class_='ok-bises')
-
-    child_div = [news.find('div', {"class": "ok-container"}
-                           ) for news in news_list]
-
-    titles = [elem.find('h2').text for elem in child_div]
-
-    detail_links = [elem.find('h2').find('a')["href"]
-                    for elem in child_div]
-
-    authors, summaries, contents, timePublished, images = scraperOnlinekhabarDetails(
-        detail_links)
-    contentsLst = []
-
-    for content in contents:
-        contentsStr = ""
-        for each in content:
-            contentsStr += each + "\n\n"
-        contentsLst.append(contentsStr)
-
-    imageIds = [link.split('/')[7] for link in images]
-    # getting the unique id of images
-
-    # '../media/posts_images/{imageIds[i]}.jpg'
-
-    # get or create method, if the model doesn't exist, it will create
-    print(len(titles), len(authors), len(summaries),
-          len(contentsLst), len(timePublished), len(images))
-
-    for i in range(len(images)):
-
-        try:
-            news = News.objects.get(title=titles[i])
-        except:
-            print("BANANANANANANANA")
-
-            response = requests.get(images[i], stream=True)
-
-            if response.status_code != requests.codes.ok:
-                continue
-            filename = f"{imageIds[i]}"
-            fp = BytesIO()
-            fp.write(response.content)
-
-            print(summaries[i])
-
-            news = News(title=titles[i], summary=summaries[i], content=contentsLst[i],
-                        author=authors[i], created=timePublished[i], source="Onlinekhabar")
-            news.save()
-            news.image.save(filename, files.File(fp))
-
-    # Write image block to temporary file
-
-    return HttpResponse(contentsLst[1])
-
-
-def scraperOnlinekhabarDetails(detailLinks):
-
-    authors = []
-    summaries = []
-    contentsLst = []
-    timePublished = []
-    images = []
-    for link in detailLinks:
-
-        while True:
-            try:
-                html = requests.get(link).text
-                break
-
-            except:
-                print("Connection Failed, Retrying in 15 seconds....")
-                time.sleep(15)
-
-        soup = BeautifulSoup(html, 'html.parser')
-        author = soup.find('span', {"class": "author-name"}).text
-        summary = soup.find(
-            'div', {"class": "ok18-single-post-content-wrap"}).find('p').getText()
-
-        allowlist = ['p']
-
-        contents = soup.find(
-            'div', {"class": "ok18-single-post-content-wrap"}).find_all('p')
-
-        content = [t.getText() for t in contents]
-
-        created = soup.find(
-            'div', {"class": "ok-news-post-hour"}).find('span').text
-        imageSrc = soup.find('div', {"class": "post-thumbnail"})
-        if imageSrc:
-            image = imageSrc.find('img')['src']
-
-            images.append(image)
-
-        authors.append(author)
-        summaries.append(summary)
-        contentsLst.append(content)
-        timePublished.append(created)
-        print("\n\n\n\n\n\n")
-
-    return authors, summaries, contentsLst, timePublished, images
-
-
-def nagarik_scraper(request):
-    while True:
-        try:
-            html = requests.get('https://nagariknews.nagariknetwork.com/').text
-            break
-
-        except:
-            print("Connect to the homepage failed, retrying in 15 seconds....")
-            time.sleep(15)
 
-    soup = BeautifulSoup(html, 'html.parser')
-    latest_news = soup.find('div', {"class": "justin"})
-    all_articles = latest_news.findAll('article', {"class": "list-group-item"})
-    titles = [article.find('h1').text for article in all_articles]
-    detail_links = [article.find('h1').find('a')["href"]
-                    for article in all_articles]
-    summaries = [article.find('p').getText() for article in all_articles]
+class ScrapeJobDetailApi(generics.RetrieveAPIView):
+    queryset = ScrapeJob.objects.all()
+    serializer_class = ScrapeJobSerializer
 
-    authors, contents, images, timePublished = scraperNagarikDetail(
-        detail_links)
-    contentsLst = []
 
-    for content in contents:
-        contentsStr = ""
-        for each in content:
-            contentsStr += each + "\n\n"
-        contentsLst.append(contentsStr)
+def hashed_media(request, path):
+    '''
+    Serves media stored under content hashed names. Their bytes can never
+    change, so clients and proxies may cache them for good.
+    '''
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
 
-    imageIds = [link.split('/')[6] for link in images]
 
-    print(len(titles), len(authors), len(summaries),
-          len(contentsLst), len(timePublished), len(images))
+def _time_param(request, name):
+    '''
+    The ISO 8601 date or time in the `name` query parameter, or None.
+    '''
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        return parse_iso(value)
+    except ValueError:
+        raise ValidationError({name: 'Expected an ISO 8601 date or time.'})
 
-    for i in range(len(images)):
-        print()
-        print(titles[i]+"\n")
-        print(contentsLst[i]+"\n")
-        print(authors[i]+"\n")
-        print(timePublished[i])
-        print(summaries[i]+"\n")
 
-        try:
-            news = News.objects.get(title=titles[i])
-        except:
-            print("BANANANANANANANA")
+@require_GET
+def export_news(request):
+    '''
+    Streams the whole corpus, or the rows of `?source=` published between
+    `?published_after=` and `?published_before=`, as `?format=ndjson` (the
+    default) or csv. `?after=<id>` resumes an export after the last id
+    received. A plain Django view, so rows go out as they are read.
+    '''
+    params = request.GET
+    output = params.get('format', 'ndjson')
+    if output not in export.FORMATS:
+        return JsonResponse({'detail': f'Formats are {", ".join(export.FORMATS)}.'}, status=400)
+    try:
+        filters = {
+            'source': params.get('source'),
+            'published_after': parse_iso(params['published_after']) if params.get('published_after') else None,
+            'published_before': parse_iso(params['published_before']) if params.get('published_before') else None,
+            'after': int(params.get('after') or 0),
+        }
+    except ValueError as e:
+        return JsonResponse({'detail': str(e)}, status=400)
+
+    lines, content_type = export.FORMATS[output]
+    response = StreamingHttpResponse(lines(export.export_rows(**filters)),
+                                     content_type=f'{content_type}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="news.{output}"'
+    return response
+
+
+class NewsListApi(CachedResponseMixin, generics.ListAPIView):
+    '''
+    The feed, newest first. `?ordering=-published_at` orders it by the
+    source's publication time instead of the ingest time, and
+    `?published_after=` and `?published_before=` select a range of it.
+    '''
+    serializer_class = NewsListSerializer
+    pagination_class = NewsCursorPagination
+    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    search_fields = ('title', 'summary', 'content', 'source')
+    ordering_fields = ['ingested_at', 'published_at']
+    ordering = '-ingested_at'
+
+    def get_queryset(self):
+        queryset = News.objects.all()
+        after = _time_param(self.request, 'published_after')
+        before = _time_param(self.request, 'published_before')
+        if after:
+            queryset = queryset.filter(published_at__gte=after)
+        if before:
+            queryset = queryset.filter(published_at__lt=before)
+        if not (after or before):
+            # the window moves with every request, not with the process start
+            since = timezone.now() - timedelta(days=getattr(settings, 'NEWS_FEED_DAYS', 3))
+            queryset = queryset.filter(ingested_at__gte=since)
+        if 'published_at' in self.request.query_params.get('ordering', ''):
+            # cursors need a value to seek from
+            queryset = queryset.exclude(published_at=None)
+
+        # the per-source feed route, or ?source= on the plain list
+        source = self.kwargs.get('source') or self.request.query_params.get('source')
+        if source:
+            source = source.lower()
+            if 'source' in self.kwargs and source not in SOURCES:
+                raise NotFound(f'Unknown source {source}.')
+            queryset = queryset.filter(source_key=source)
+
+        return queryset.only(*NewsListSerializer.LIST_FIELDS)
+
+
+class NewsSearchApi(CachedResponseMixin, generics.ListAPIView):
+    '''
+    Full-text search of `?q=` over the search index, best matches first.
+    Only the articles of the requested page are loaded.
+    '''
+    serializer_class = NewsSearchSerializer
+    pagination_class = NewsSearchPagination
+
+    def query(self):
+        return self.request.query_params.get('q', '')
+
+    def get_queryset(self):
+        return search.rank(self.query())
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['terms'] = set(search.tokenize(self.query()))
+        return context
+
+    def list(self, request, *args, **kwargs):
+        if not self.query().strip():
+            return Response({'detail': 'The q parameter is required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        hits = self.paginate_queryset(self.get_queryset())
+        rows = (News.objects.only(*NewsSearchSerializer.LIST_FIELDS)
+                .in_bulk([hit['news'] for hit in hits]))
+        results = []
+        for hit in hits:
+            # skip articles deleted since the ranking query
+            if hit['news'] in rows:
+                rows[hit['news']].score = hit['score']
+                results.append(rows[hit['news']])
+        return self.get_paginated_response(self.get_serializer(results, many=True).data)
+
+
+class NewsDetailApi(CachedResponseMixin, generics.RetrieveAPIView):
+    queryset = News.objects.defer(*NewsSerializer.Meta.exclude).prefetch_related('comments')
+    serializer_class = NewsSerializer
 
-            response = requests.get(images[i], stream=True)
 
-            if response.status_code != requests.codes.ok:
-                continue
-            filename = f"{imageIds[i]}"
-            fp = BytesIO()
-            fp.write(response.content)
+class StoryMixin:
+    '''
+    Stories with their articles loaded in one extra query.
+    '''
 
+    def get_queryset(self):
+        articles = (News.objects.only(*NewsListSerializer.LIST_FIELDS)
+                    .order_by('ingested_at'))
+        return Story.objects.prefetch_related(Prefetch('articles', queryset=articles))
 
-            news = News(title=titles[i], summary=summaries[i], content=contentsLst[i],
-                        author=authors[i], created=timePublished[i], source="Nagarik News")
-            news.save()
-            news.image.save(filename, files.File(fp))
 
-    return HttpResponse(timePublished[0])
+class StoryListApi(StoryMixin, CachedResponseMixin, generics.ListAPIView):
+    serializer_class = StorySerializer
+    pagination_class = StoryCursorPagination
 
 
-def scraperNagarikDetail(detailLinks):
-    authors = []
+class StoryDetailApi(StoryMixin, CachedResponseMixin, generics.RetrieveAPIView):
+    serializer_class = StorySerializer
 
-    contentsLst = []
-    timePublished = []
-    images = []
-    for link in detailLinks:
 
-        while True:
-            try:
-                html = requests.get(
-                    f"https://nagariknews.nagariknetwork.com/{link}").text
-                break
+@api_view(['GET'])
+def cache_stats(request):
+    '''
+    Hit ratio and estimated time saved by the response cache of this process.
+    '''
+    return Response(apicache.stats.stats())
 
-            except:
-                print("Connection Failed, Retrying in 15 seconds....")
-                time.sleep(15)
 
-        soup = BeautifulSoup(html, 'html.parser')
-        author = soup.find('author').find('a').text
-        contents = soup.find('article').find_all('p')
-        image = soup.find(
-            'div', {"class": "main-news-section"}).find('img')['src']
+@require_GET
+def metrics_view(request):
+    '''
+    Counters and timings of this process in the Prometheus text format. Scrapes
+    run in the worker, which serves its own on `scrapeworker --metrics-port`.
+    '''
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
-        content = [t.getText() for t in contents]
-        published = soup.find('time').getText()
 
-        authors.append(author)
-        contentsLst.append(content)
-        images.append(image)
-        timePublished.append(published)
+class CommentsListApi(generics.ListAPIView):
+    queryset = Comment.objects.all()
+    serializer_class = CommentSerializer
+    pagination_class = CommentCursorPagination
 
-    return authors, contentsLst, images, timePublished
 
+class NewsCommentsApi(generics.ListAPIView):
+    '''
+    The comments of one article, newest first.
+    '''
+    serializer_class = CommentSerializer
+    pagination_class = CommentCursorPagination
 
-class NewsListApi(generics.ListAPIView):
-    current_date = datetime.now()
-    previous_date = current_date - timedelta(days=3)
-    queryset = News.objects.filter(
-        created_ad__range=[previous_date, current_date])
+    def get_queryset(self):
+        return Comment.objects.filter(news_id=self.kwargs['pk'])
 
-    serializer_class = NewsSerializer
-    filter_backends = [filters.SearchFilter]
-    search_fields = ('title', 'summary', 'content', 'source')
 
+def _count_comments(news_id, change):
+    News.objects.filter(id=news_id).update(comment_count=F('comment_count') + change)
 
-class NewsDetailApi(generics.RetrieveAPIView):
-    queryset = News.objects.all()
-    serializer_class = NewsSerializer
 
+class CommentWriteMixin:
+    '''
+    Keeps News.comment_count in step with the comments, in the same
+    transaction as the change. Comments are part of the cached news
+    responses, so every change invalidates the cache once committed.
+    '''
 
-class CommentsListApi(generics.ListAPIView):
+    @transaction.atomic
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        _count_comments(serializer.instance.news_id, 1)
+        transaction.on_commit(apicache.bump_version)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_news_id = serializer.instance.news_id
+        super().perform_update(serializer)
+        if serializer.instance.news_id != old_news_id:
+            _count_comments(old_news_id, -1)
+            _count_comments(serializer.instance.news_id, 1)
+        transaction.on_commit(apicache.bump_version)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        _count_comments(instance.news_id, -1)
+        transaction.on_commit(apicache.bump_version)
+
+
+class CommentCreateApi(CommentWriteMixin, generics.CreateAPIView):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
 
 
-class CommentCreateApi(generics.CreateAPIView):
-    queryset = Comment.objects.all()
+class OwnCommentMixin:
+    '''
+    Looks comments up among the requesting user's own, so the lookup and the
+    ownership check are one query and other users' comments are not found.
+    '''
     serializer_class = CommentSerializer
+    permission_classes = [permissions.IsAuthenticated, IsTheCommentAuthor]
 
+    def get_queryset(self):
+        return Comment.objects.filter(user=self.request.user)
 
-class CommentUpdateApi(generics.UpdateAPIView):
-    queryset = Comment.objects.all()
-    serializer_class = CommentSerializer
-    permission_classes = [permissions.IsAuthenticated, IsTheCommentAuthor]
+
+class CommentUpdateApi(OwnCommentMixin, CommentWriteMixin, generics.UpdateAPIView):
     # authentication_classes = [authentication.TokenAuthentication]
+    pass
 
 
-class CommentDeleteApi(generics.DestroyAPIView):
-    queryset = Comment.objects.all()
-    serializer_class = CommentSerializer
-    permission_classes = [permissions.IsAuthenticated, IsTheCommentAuthor]
+class CommentDeleteApi(OwnCommentMixin, CommentWriteMixin, generics.DestroyAPIView):
+    pass
@@ -51,9 +51,7 @@ const Feed = ({ data, onClickRefreshHandler }: FeedProps) => {
               <FeedCard
                 key={newsItem.id}
                 title={newsItem.title}
-                image={newsItem.image}
-                author={newsItem.author}
-                content={newsItem.content}
+                image={newsItem.thumbnail}
                 created={newsItem.created}
                 source={newsItem.source}
                 summary={newsItem.summary}
@@ -67,9 +65,7 @@ const Feed = ({ data, onClickRefreshHandler }: FeedProps) => {
             <FeedCard
               key={newsItem.id}
               title={newsItem.title}
-              image={newsItem.image}
-              author={newsItem.author}
-              content={newsItem.content}
+              image={newsItem.thumbnail}
               created={newsItem.created}
               source={newsItem.source}
               summary={newsItem.summary}
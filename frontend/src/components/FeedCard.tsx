@@ -23,8 +23,8 @@ import { useNavigate } from "react-router-dom";
 interface FeedCardProps {
   title: string;
   id?: number;
-  author: string;
-  content: string;
+  author?: string;
+  content?: string;
   created: string;
   image: string;
   source: string;
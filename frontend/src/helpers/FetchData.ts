@@ -1,20 +1,30 @@
 export const fetchData = async (source: string) => {
+  // the source's own feed, cursor paginated with the articles in `results`
   const sendRequest = async (source: string) => {
     const response = await fetch(
-      `http://127.0.0.1:8000/api/news/newslist/?search=${source}`
+      `http://127.0.0.1:8000/api/news/sources/${source.toLowerCase()}/news/`
     );
-    const data = response.json();
-    return data;
+    const data = await response.json();
+    return data.results;
   };
-  const data = await sendRequest(source);
-
-  if (!data) {
-    await scrape(source);
-    const response = await sendRequest(source);
-    return response;
-  }
+  // sources are scraped on a schedule by the worker, never on a page view
+  return sendRequest(source);
+};
 
-  return data;
+// Calls `onArticle` with every article of `source` saved from now on, pushed
+// over Server-Sent Events. EventSource reconnects by itself and the server
+// replays what was missed. Returns the function that closes the stream.
+export const subscribeToNews = (
+  source: string,
+  onArticle: (article: { id: number; source: string; title: string }) => void
+) => {
+  const events = new EventSource(
+    `http://127.0.0.1:8000/api/news/events/?sources=${source.toLowerCase()}`
+  );
+  events.addEventListener("article", (event) =>
+    onArticle(JSON.parse((event as MessageEvent).data))
+  );
+  return () => events.close();
 };
 
 export const scrape = async (source: string) => {
@@ -39,9 +49,24 @@ export const scrape = async (source: string) => {
       urlKeyword = "ekanscraper";
       break;
   }
-  const url = `http://127.0.0.1:8000/api/news/${urlKeyword}`;
+  const url = `http://127.0.0.1:8000/api/news/${urlKeyword}/`;
+
+  const response = await fetch(url, { method: "POST" });
+  const job = await response.json();
 
-  await fetch(url);
+  return waitForJob(job.id);
+};
 
-  return true;
+// Scrapes run on the scrape worker, so poll the job until it has finished.
+export const waitForJob = async (jobId: number, interval = 2000) => {
+  while (true) {
+    const response = await fetch(
+      `http://127.0.0.1:8000/api/news/scrape/jobs/${jobId}/`
+    );
+    const job = await response.json();
+    if (job.status === "done" || job.status === "failed") {
+      return job;
+    }
+    await new Promise((resolve) => setTimeout(resolve, interval));
+  }
 };
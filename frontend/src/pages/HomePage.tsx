@@ -3,28 +3,28 @@ import React, { useEffect, useState } from "react";
 import Navbar from "../components/Navbar";
 import Sidebar from "../components/Sidebar";
 import Feed from "../components/Feed";
-import { fetchData, scrape } from "../helpers/FetchData";
+import { fetchData, subscribeToNews } from "../helpers/FetchData";
 import { useParams } from "react-router-dom";
 
+// the list endpoint only sends what a feed card shows, see NewsListSerializer
 export interface newsStruct {
   id: number;
-  author: string;
-  content: string;
   created: string;
-  image: string;
   source: string;
   summary: string;
   title: string;
-  created_ad: string;
+  thumbnail: string;
+  ingested_at: string;
+  comment_count: number;
 }
 
 const HomePage = () => {
   const params = useParams();
   const [data, setData] = useState<newsStruct[]>([]);
 
+  // reloads the list only; new articles are pushed as the worker saves them
   const handleRefresh = async () => {
-    await scrape(params.source!);
-    await fetchData(params.source!);
+    setData(await fetchData(params.source!));
   };
 
   useEffect(() => {
@@ -33,6 +33,17 @@ const HomePage = () => {
       setData(data);
     };
     getInitialData();
+
+    // a scrape saves its articles in a burst, so reload once it has settled
+    let reload: ReturnType<typeof setTimeout>;
+    const unsubscribe = subscribeToNews(params.source!, () => {
+      clearTimeout(reload);
+      reload = setTimeout(getInitialData, 1000);
+    });
+    return () => {
+      clearTimeout(reload);
+      unsubscribe();
+    };
   }, [params.source]);
 
   return (